@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+from collections import defaultdict
+import numpy as np
+import mip
+from instance import *
+from solution import *
+import solver
+from closure import ClosureIndex
+from generate import PRESETS, SWEEP, generate_preset
+
+instances_paths = ['./instances/', './bigger_instances/']
+default_synthetic = ['e_intriguing:10', 'c_urgent:4']
+
+PHASES = ['load', 'extract', 'heuristic', 'mip', 'merge', 'solve_other', 'print', 'load_solution', 'eval']
+
+
+class PhaseTimer():
+    """
+    Accumulates the wall time and the number of calls of each phase of the pipeline.
+    """
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+    def wrap(self, name: str, fn):
+        def timed(*args, **kwargs):
+            with self.phase(name):
+                return fn(*args, **kwargs)
+        return timed
+
+
+@contextlib.contextmanager
+def instrumented_solver(timer: PhaseTimer):
+    """
+    Temporarily replaces the phase functions used by solver.solve_instance with timed wrappers.
+    Sub-instance extraction covers both building the ClosureIndex and extracting each sub-instance.
+    """
+
+    class TimedClosureIndex(ClosureIndex):
+        def __init__(self, instance):
+            with timer.phase('extract'):
+                super().__init__(instance)
+
+        def sub_instance(self, target_name: str) -> SubInstance:
+            with timer.phase('extract'):
+                return super().sub_instance(target_name)
+
+    patched = {'ClosureIndex': TimedClosureIndex,
+               'heuristically_solve_sub_instance': timer.wrap('heuristic', solver.heuristically_solve_sub_instance),
+               'optimally_solve_sub_instance': timer.wrap('mip', solver.optimally_solve_sub_instance),
+               'merge_sub_instances': timer.wrap('merge', solver.merge_sub_instances)}
+    saved = {name: getattr(solver, name) for name in patched}
+    for name, fn in patched.items():
+        setattr(solver, name, fn)
+    try:
+        yield
+    finally:
+        for name, fn in saved.items():
+            setattr(solver, name, fn)
+
+
+def run_pipeline(in_path: str, out_path: str, timer: PhaseTimer) -> int:
+    """
+    Runs the whole pipeline of compute_solution on a single instance (serially, without any cache),
+    timing each phase. Returns the score of the solution.
+    """
+    with timer.phase('load'):
+        instance = loadInstance(in_path)
+    with open(os.devnull, 'w') as devnull, instrumented_solver(timer), contextlib.redirect_stdout(devnull):
+        with timer.phase('solve'):
+            solution = solver.solve_instance(instance)
+    with timer.phase('print'):
+        solution.printSolution(out_path)
+    with timer.phase('load_solution'):
+        solution_from_file = loadSolution(out_path, instance)
+    with timer.phase('eval'):
+        score = solution_from_file.evalCheck(instance)
+    timer.times['solve_other'] = timer.times['solve'] - sum(timer.times[p] for p in ['extract', 'heuristic', 'mip', 'merge'])
+    return score
+
+
+def replicate_instance(in_path: str, copies: int, out_path: str):
+    """
+    Writes a synthetic instance made of copies disjoint replicas of the instance in in_path
+    (same number of servers, file names prefixed by the index of the replica).
+    """
+    instance = loadInstance(in_path)
+    files = list(instance.files.values())
+    with open(out_path, 'w') as fp:
+        fp.write(f'{len(files) * copies} {len(instance.targets) * copies} {instance.nservers}\n')
+        for r in range(copies):
+            for cf in files:
+                fp.write(f'r{r}_{cf.name} {cf.ctime} {cf.rtime}\n')
+                fp.write(' '.join([str(len(cf.dependencies))] + [f'r{r}_{dep}' for dep in cf.dependencies]) + '\n')
+        for r in range(copies):
+            for t in instance.targets:
+                cf = instance.files[t]
+                fp.write(f'r{r}_{t} {cf.deadline} {cf.points}\n')
+
+
+def benchmark_instance(in_path: str, repeat: int = 1, memory: bool = True) -> dict:
+    """
+    Benchmarks a single instance: the time of each phase is the minimum over repeat runs,
+    the peak memory (traced by tracemalloc) is measured in a separate run, since tracing slows everything down.
+
+    Args:
+        in_path (str): path of the instance
+        repeat (int): number of timed runs
+        memory (bool): whether to measure the peak memory
+    """
+    result = {'phases': {}, 'calls': {}}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_path = os.path.join(tmp_dir, 'solution.out')
+        for _ in range(repeat):
+            timer = PhaseTimer()
+            score = run_pipeline(in_path, out_path, timer)
+            for phase in PHASES + ['solve']:
+                best = result['phases'].get(phase)
+                result['phases'][phase] = timer.times[phase] if best is None else min(best, timer.times[phase])
+                result['calls'][phase] = timer.calls[phase]
+        result['calls'].pop('solve_other')
+        result['total'] = sum(result['phases'][phase] for phase in PHASES)
+        result['score'] = score
+        if memory:
+            tracemalloc.start()
+            run_pipeline(in_path, out_path, PhaseTimer())
+            result['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+    return result
+
+
+def compare(results: dict, baseline: dict, time_threshold: float, memory_threshold: float,
+            score_threshold: float, min_time: float) -> "list[str]":
+    """
+    Compares the results with a baseline and returns a description of each regression found:
+    a phase (or the total) slower by more than time_threshold (relative, ignoring phases faster than
+    min_time seconds in the baseline), a peak memory larger by more than memory_threshold (relative) or a
+    score lower by more than score_threshold (relative).
+    """
+    regressions = []
+    for name, res in results['instances'].items():
+        base = baseline['instances'].get(name)
+        if base is None:
+            continue
+        for phase in PHASES + ['total']:
+            new_time = res['total'] if phase == 'total' else res['phases'].get(phase, 0)
+            old_time = base['total'] if phase == 'total' else base['phases'].get(phase, 0)
+            if old_time >= min_time and new_time > old_time * (1 + time_threshold):
+                regressions.append(f'{name}: {phase} {old_time:.3f}s -> {new_time:.3f}s')
+        if 'peak_mb' in res and 'peak_mb' in base and res['peak_mb'] > base['peak_mb'] * (1 + memory_threshold):
+            regressions.append(f'{name}: peak memory {base["peak_mb"]:.1f}MB -> {res["peak_mb"]:.1f}MB')
+        if res['score'] < base['score'] * (1 - score_threshold):
+            regressions.append(f'{name}: score {base["score"]} -> {res["score"]}')
+    return regressions
+
+
+def print_results(results: dict):
+    print(f'{"instance":<24}' + ''.join(f'{phase:>14}' for phase in PHASES + ['total', 'peak MB', 'score']))
+    for name, res in results['instances'].items():
+        row = f'{name:<24}' + ''.join(f'{res["phases"][phase]:>14.3f}' for phase in PHASES)
+        row += f'{res["total"]:>14.3f}{res.get("peak_mb", float("nan")):>14.1f}{res["score"]:>14}'
+        print(row)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Time each phase of the pipeline on the instances.')
+    parser.add_argument('instances', nargs='*', help='instances to benchmark (default: all the shipped ones)')
+    parser.add_argument('--synthetic', action='append', default=None, metavar='NAME:COPIES',
+                        help=f'also benchmark a shipped instance replicated COPIES times (default: {" ".join(default_synthetic)})')
+    parser.add_argument('--no-synthetic', action='store_true', help='skip the synthetic instances')
+    parser.add_argument('--generated', action='append', default=[], choices=sorted(PRESETS), metavar='PRESET',
+                        help='also benchmark an instance generated from a preset of generate.py')
+    parser.add_argument('--sweep', action='store_true', help='also benchmark the generated instances of the preset sweep')
+    parser.add_argument('--repeat', type=int, default=1, help='timed runs per instance (the fastest one is kept)')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure the peak memory')
+    parser.add_argument('--output', default='benchmark.json', help='where to write the results')
+    parser.add_argument('--baseline', default=None, help='results of a previous run to compare with')
+    parser.add_argument('--time-threshold', type=float, default=0.2, help='tolerated relative slowdown of a phase')
+    parser.add_argument('--memory-threshold', type=float, default=0.2, help='tolerated relative increase of the peak memory')
+    parser.add_argument('--score-threshold', type=float, default=0.0, help='tolerated relative decrease of the score')
+    parser.add_argument('--min-time', type=float, default=0.05, help='phases faster than this (in the baseline) are not compared')
+    args = parser.parse_args()
+
+    shipped = {}
+    for path in instances_paths:
+        for fn in sorted(os.listdir(path)):
+            if fn.endswith('.in'):
+                shipped[fn[:-3]] = f'{path}{fn}'
+    if args.instances:
+        selected = {os.path.basename(p).replace('.in', ''): (shipped.get(p) or p) for p in args.instances}
+    else:
+        selected = shipped
+
+    results = {'meta': {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+                        'numpy': np.__version__, 'mip': mip.__version__, 'machine': platform.platform(),
+                        'cpus': os.cpu_count(), 'repeat': args.repeat},
+               'instances': {}}
+    with tempfile.TemporaryDirectory() as synthetic_dir:
+        synthetic = [] if args.no_synthetic else (args.synthetic or default_synthetic)
+        for spec in synthetic:
+            name, copies = spec.split(':')
+            path = os.path.join(synthetic_dir, f'{name}_x{copies}.in')
+            replicate_instance(shipped[name], int(copies), path)
+            selected[f'{name}_x{copies}'] = path
+        for name in args.generated + (SWEEP if args.sweep else []):
+            path = os.path.join(synthetic_dir, f'{name}.in')
+            generate_preset(name, path)
+            selected[f'generated-{name}'] = path
+
+        for name, path in selected.items():
+            print(f'benchmarking {name}...', file=sys.stderr)
+            results['instances'][name] = benchmark_instance(path, args.repeat, not args.no_memory)
+
+    with open(args.output, 'w') as fp:
+        json.dump(results, fp, indent=2)
+    print_results(results)
+
+    if args.baseline is not None:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        regressions = compare(results, baseline, args.time_threshold, args.memory_threshold,
+                              args.score_threshold, args.min_time)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) with respect to {args.baseline}:')
+            for regression in regressions:
+                print(f'  {regression}')
+            sys.exit(1)
+        print(f'\nno regressions with respect to {args.baseline}')
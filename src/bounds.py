@@ -0,0 +1,53 @@
+from closure import ClosureIndex
+
+
+class CriticalPathBounds():
+    """
+    Lower bounds on the time each file can be ready at the earliest, and upper bounds on the score of
+    each target, computed in a single pass over the dependency DAG (in topological order).
+    The finish time of a file is bounded below both by the longest chain of compilations ending with it
+    (dependencies compiled on the same server need no replication) and by the work of all the files it
+    depends on spread evenly over the servers, followed by its own compilation.
+
+    Args:
+        closure_index (ClosureIndex): the closure index of the instance
+    """
+
+    def __init__(self, closure_index: ClosureIndex):
+        self.closure_index = closure_index
+        inst = closure_index.instance
+        ctime = inst.ctime.tolist()
+        offsets, indices = closure_index.offsets, closure_index.indices
+        chain = [0] * inst.nfiles
+        for fid in closure_index.topo_order.tolist():
+            longest = 0
+            for k in range(offsets[fid], offsets[fid + 1]):
+                longest = max(longest, chain[indices[k]])
+            chain[fid] = longest + ctime[fid]
+        self.chain = chain      # file ID -> length of the longest chain of compilations ending with it
+        self.ctime = ctime
+        self.lower_bounds = {}
+
+    def finish_lower_bound(self, fid: int) -> int:
+        """
+        Returns a lower bound on the time file fid can be compiled by.
+        """
+        if fid not in self.lower_bounds:
+            nservers = self.closure_index.instance.nservers
+            work = sum(self.ctime[d] for d in self.closure_index.closure(fid)) - self.ctime[fid]
+            self.lower_bounds[fid] = max(self.chain[fid], -(-work // nservers) + self.ctime[fid])
+        return self.lower_bounds[fid]
+
+    def score_upper_bound(self, fid: int) -> int:
+        """
+        Returns an upper bound on the points target fid can be worth: 0 if it can never meet its deadline.
+        """
+        inst = self.closure_index.instance
+        deadline = int(inst.deadline[fid])
+        finish = self.finish_lower_bound(fid)
+        if finish > deadline:
+            return 0
+        return deadline - finish + int(inst.points[fid])
+
+    def hopeless(self, fid: int) -> bool:
+        return self.score_upper_bound(fid) == 0
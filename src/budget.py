@@ -0,0 +1,72 @@
+import time
+
+
+class TimeBudget():
+    """
+    Run-level time budget shared by a set of tasks (the MIP sub-problems of an instance).
+    Tasks are queued with their expected gain; next() hands out the task with the highest gain together
+    with a time slice proportional to its share of the total pending gain. The slices are carved out of
+    what is left of the budget at that moment, so time a task does not use goes back to the pool for the
+    following ones. With several workers the pool is measured in worker-seconds, minus the unused part
+    of the slices of the tasks still running.
+
+    Args:
+        seconds (float): wall-clock budget of the whole run, counted from the creation of the object
+        workers (int): number of tasks that run at the same time
+        reserve (float): fraction of the budget kept aside for the work following the tasks (e.g. merging)
+        min_slice (float): shortest slice worth giving to a task, in seconds
+    """
+
+    def __init__(self, seconds: float, workers: int = 1, reserve: float = 0.1, min_slice: float = 0.2):
+        self.start = time.time()
+        self.deadline = self.start + seconds * (1 - reserve)
+        self.workers = workers
+        self.min_slice = min_slice
+        self.pending = {}   # task -> [gain, shortest acceptable slice]
+        self.running = {}   # task -> [start time, slice]
+
+    def remaining(self) -> float:
+        """
+        Wall-clock seconds left before the tasks must be over.
+        """
+        return max(0.0, self.deadline - time.time())
+
+    def available(self) -> float:
+        """
+        Worker-seconds not yet promised to any task.
+        """
+        now = time.time()
+        promised = sum(max(0.0, seconds - (now - started)) for started, seconds in self.running.values())
+        return max(0.0, self.remaining() * self.workers - promised)
+
+    def add(self, task, gain: float, at_least: float = 0.0):
+        """
+        Queues a task (any hashable) with its expected gain; it will not be given a slice shorter than at_least.
+        """
+        if gain > 0:
+            self.pending[task] = [gain, at_least]
+
+    def next(self):
+        """
+        Returns [task, seconds] for the pending task with the highest gain, or None if there is no pending
+        task or no time left for one. Tasks whose shortest acceptable slice no longer fits are dropped.
+        """
+        while self.pending:
+            pool = min(self.available(), self.remaining())
+            if pool < self.min_slice:
+                return None
+            total_gain = sum(gain for gain, _ in self.pending.values())
+            task = max(self.pending, key=lambda t: self.pending[t][0])
+            gain, at_least = self.pending.pop(task)
+            if at_least > pool:
+                continue
+            seconds = min(pool, max(self.available() * gain / total_gain, at_least, self.min_slice))
+            self.running[task] = [time.time(), seconds]
+            return [task, seconds]
+        return None
+
+    def done(self, task):
+        """
+        Marks a task handed out by next() as finished: the unused part of its slice goes back to the pool.
+        """
+        del self.running[task]
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+from solution import *
+import telemetry
+
+
+def schedule_steps(solution: Solution) -> list:
+    """
+    Returns the steps of a schedule as [file, server, start] lists, in filesCompTimeList order.
+    """
+    return [[step.fname, step.server, step.sched_time] for step in solution.filesCompTimeList]
+
+
+def schedule_from_steps(steps: list, instance, nservers: int) -> Solution:
+    """
+    Rebuilds the schedule returned by schedule_steps: recording the steps backwards gives back the same
+    order, since a new step goes before the steps starting at the same time.
+    """
+    solution = Solution(nservers)
+    for fname, server, start in reversed(steps):
+        solution.recordNewCompilation(instance, start, server, fname)
+    return solution
+
+
+class Checkpoint():
+    """
+    Crash-safe progress of a run of solve_instance, to resume it after it is killed.
+    The state (the schedule of each solved sub-instance, the merge position and the merged schedule so far)
+    goes to the sidecar file <out_path>.state; the best schedule so far (the best sub-instance schedule
+    while solving, then the merged one) is also written to out_path, so that a valid output exists at any
+    time. Both files are written to a temporary file first and then atomically renamed, at most once every
+    interval seconds. A state left by a run with a different fingerprint is ignored.
+
+    Args:
+        out_path (str): where the best schedule so far is written
+        fingerprint (dict): identifies the input and the options of the run (JSON-serialisable)
+        interval (float): minimum time between two writes, in seconds
+    """
+
+    def __init__(self, out_path: str, fingerprint: dict, interval: float = 30.0):
+        self.out_path = out_path
+        self.state_path = f'{out_path}.state'
+        self.fingerprint = fingerprint
+        self.interval = interval
+        self.last_write = time.time()
+        self.solved = {}        # key of a solved sub-instance -> its schedule steps
+        self.merge = None       # [number of merge steps done, merged schedule steps] left by a previous run
+        self.position = 0       # number of merge steps done by this run, and the merged schedule so far
+        self.merged_solution = None
+        self.best = None        # [score, schedule] to be written to out_path
+        self.dirty = False
+        try:
+            with open(self.state_path) as fp:
+                state = json.load(fp)
+        except (OSError, ValueError):
+            return
+        if state.get('fingerprint') == fingerprint:
+            self.solved = state['solved']
+            self.merge = state['merge']
+            telemetry.count('checkpoint.resumed_targets', len(self.solved))
+
+    @staticmethod
+    def key(sub_instance) -> str:
+        return ' '.join(sub_instance.targets)
+
+    def sub_solution(self, sub_instance):
+        """
+        Returns the schedule of a sub-instance solved by a previous run, or None.
+        """
+        steps = self.solved.get(self.key(sub_instance))
+        if steps is None:
+            return None
+        return schedule_from_steps(steps, sub_instance, sub_instance.nservers)
+
+    def add_solved(self, sub_instance, solution: Solution, score: int):
+        """
+        Records the schedule of a solved sub-instance, worth score points.
+        """
+        self.solved[self.key(sub_instance)] = schedule_steps(solution)
+        if self.merged_solution is None and (self.best is None or score > self.best[0]):
+            self.best = [score, solution]
+        self.dirty = True
+        self.maybe_save()
+
+    def merge_state(self, instance):
+        """
+        Returns [number of merge steps done, merged schedule] if a previous run got to the merge, or None.
+        """
+        if self.merge is None:
+            return None
+        position, steps = self.merge
+        return [position, schedule_from_steps(steps, instance, instance.nservers)]
+
+    def merged(self, position: int, solution: Solution):
+        """
+        Records the merged schedule after position merge steps (it is only serialised when saved).
+        """
+        self.position, self.merged_solution = position, solution
+        self.best = [None, solution]
+        self.dirty = True
+        self.maybe_save()
+
+    def maybe_save(self):
+        if self.dirty and time.time() - self.last_write >= self.interval:
+            self.save()
+
+    def save(self):
+        with telemetry.span('checkpoint', solved=len(self.solved), merged=self.position):
+            if self.best is not None:
+                tmp_path = f'{self.out_path}.tmp'
+                self.best[1].printSolution(tmp_path)
+                os.replace(tmp_path, self.out_path)
+            tmp_path = f'{self.state_path}.tmp'
+            if self.merged_solution is not None:
+                self.merge = [self.position, schedule_steps(self.merged_solution)]
+            with open(tmp_path, 'w') as fp:
+                json.dump({'fingerprint': self.fingerprint, 'solved': self.solved, 'merge': self.merge}, fp)
+            os.replace(tmp_path, self.state_path)
+        self.last_write = time.time()
+        self.dirty = False
+
+    def finish(self):
+        """
+        Removes the state once the run is over (its output written).
+        """
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
@@ -0,0 +1,142 @@
+import numpy as np
+from instance import *
+
+
+class ClosureIndex():
+    """
+    Index of the transitive dependencies of the files of an instance.
+    The dependency DAG is topologically sorted once; the closure of each queried file is then
+    computed at most once and reused (also as a building block) by all the later queries.
+
+    Args:
+        instance (Instance): the instance to index (converted to a CompactInstance if needed)
+    """
+
+    def __init__(self, instance):
+        self.instance = compactInstance(instance)
+        self.offsets = self.instance.depOffsets.tolist()
+        self.indices = self.instance.depIndices.tolist()
+        self.closures = {}     # file ID -> closure IDs, dependencies first and file last
+        self.ancestor_ids = {}  # file ID -> sorted IDs of all the files it depends on
+        self._topo_order = None
+
+    @property
+    def topo_order(self) -> np.ndarray:
+        """
+        File IDs in a topological order of the whole dependency DAG (dependencies first).
+        """
+        if self._topo_order is None:
+            inst = self.instance
+            n = inst.nfiles
+            ndeps = np.diff(inst.depOffsets)
+            # build the reverse (dependency -> dependents) adjacency in CSR form
+            owners = np.repeat(np.arange(n), ndeps)
+            by_dep = np.argsort(inst.depIndices, kind='stable')
+            rev_offsets = np.zeros(n + 1, dtype=np.int64)
+            rev_offsets[1:] = np.cumsum(np.bincount(inst.depIndices, minlength=n))
+            rev_offsets = rev_offsets.tolist()
+            rev_indices = owners[by_dep].tolist()
+            missing = ndeps.tolist()
+            order = [fid for fid in range(n) if missing[fid] == 0]
+            head = 0
+            while head < len(order):
+                fid = order[head]
+                head += 1
+                for dependent in rev_indices[rev_offsets[fid]:rev_offsets[fid+1]]:
+                    missing[dependent] -= 1
+                    if missing[dependent] == 0:
+                        order.append(dependent)
+            assert(len(order) == n)    # the dependencies must form a DAG
+            self._topo_order = np.array(order, dtype=np.int64)
+        return self._topo_order
+
+    def closure(self, fid: int) -> "list[int]":
+        """
+        Returns the IDs of fid and of all the files it (transitively) depends on, each exactly once,
+        in the order of a post-order DFS visiting the dependencies of each file from the last one.
+        This is a topological order with fid last, and the same order the solver historically used.
+
+        Args:
+            fid (int): the ID of the file
+        """
+        cached = self.closures.get(fid)
+        if cached is not None:
+            return cached
+
+        offsets, indices, closures = self.offsets, self.indices, self.closures
+        seen = {fid}
+        order = []
+        stack = [[fid, offsets[fid + 1] - 1]]
+        while stack:
+            top = stack[-1]
+            node, pos = top
+            lo = offsets[node]
+            while pos >= lo and indices[pos] in seen:
+                pos -= 1
+            if pos < lo:
+                stack.pop()
+                order.append(node)
+                continue
+            child = indices[pos]
+            top[1] = pos - 1
+            sub = closures.get(child)
+            if sub is not None:
+                # every seen file which is not on the stack has its whole closure already in order
+                new = [x for x in sub if x not in seen]
+                order.extend(new)
+                seen.update(new)
+            else:
+                seen.add(child)
+                stack.append([child, offsets[child + 1] - 1])
+
+        closures[fid] = order
+        return order
+
+    def ancestors(self, fid: int) -> np.ndarray:
+        """
+        Returns the sorted IDs of all the files fid (transitively) depends on.
+
+        Args:
+            fid (int): the ID of the file
+        """
+        anc = self.ancestor_ids.get(fid)
+        if anc is None:
+            anc = np.sort(np.array(self.closure(fid)[:-1], dtype=np.int64))
+            self.ancestor_ids[fid] = anc
+        return anc
+
+    def depends_on(self, fid: int, other: int) -> bool:
+        """
+        Whether file fid (transitively) depends on file other.
+        """
+        anc = self.ancestors(fid)
+        pos = np.searchsorted(anc, other)
+        return bool(pos < len(anc) and anc[pos] == other)
+
+    def sub_instance(self, target: str) -> SubInstance:
+        """
+        Builds the sub-instance made of target and of all the files it depends on, dependencies first.
+
+        Args:
+            target (str): the name of the target file
+        """
+        fid = self.instance.fileIds[target]
+        return self.instance.subInstance(fid, self.closure(fid))
+
+    def cluster_sub_instance(self, targets: "list[str]") -> SubInstance:
+        """
+        Builds the sub-instance made of several targets and of all the files they depend on: the closures
+        of the targets one after the other (in the given order), each file kept at its first occurrence.
+        The first target is the main one (see SubInstance).
+
+        Args:
+            targets (list[str]): the names of the target files
+        """
+        tids = [self.instance.fileIds[target] for target in targets]
+        seen = set()
+        fids = []
+        for tid in tids:
+            new = [fid for fid in self.closure(tid) if fid not in seen]
+            fids.extend(new)
+            seen.update(new)
+        return self.instance.subInstance(tids[0], fids, tids)
@@ -0,0 +1,47 @@
+from closure import ClosureIndex
+
+
+def cluster_targets(closure_index: ClosureIndex, targets: "list[str]", threshold: float) -> "list[list[str]]":
+    """
+    Groups the targets whose closures overlap: targets are taken by decreasing closure size, and each one
+    joins the cluster whose files (the union of the closures of its targets) have the highest Jaccard
+    similarity with its closure, provided it is above threshold; otherwise it starts a new cluster.
+    Only the clusters sharing files with a closure are compared with it (through an index from each file
+    to the clusters holding it), so targets with disjoint closures cost nothing.
+    Clusters are returned in the order of their first target in targets, the targets of each cluster by
+    earliest deadline (then most points) first, which is the order they are scheduled in.
+
+    Args:
+        closure_index (ClosureIndex): the closure index of the instance
+        targets (list[str]): the names of the targets to cluster
+        threshold (float): minimum Jaccard similarity (in [0, 1]) for a target to join a cluster
+    """
+    inst = closure_index.instance
+    order = {target: i for i, target in enumerate(targets)}
+    closures = {target: closure_index.closure(inst.fileIds[target]) for target in targets}
+    clusters = []       # targets of each cluster
+    sizes = []          # number of files of each cluster
+    holders = {}        # file ID -> clusters holding it
+    for target in sorted(targets, key=lambda t: -len(closures[t])):
+        shared = {}
+        for fid in closures[target]:
+            for c in holders.get(fid, ()):
+                shared[c] = shared.get(c, 0) + 1
+        best, best_similarity = None, threshold
+        for c, common in shared.items():
+            similarity = common / (sizes[c] + len(closures[target]) - common)
+            if similarity > best_similarity or (similarity == best_similarity and best is not None and c < best):
+                best, best_similarity = c, similarity
+        if best is None:
+            best = len(clusters)
+            clusters.append([])
+            sizes.append(0)
+        clusters[best].append(target)
+        sizes[best] += len(closures[target]) - shared.get(best, 0)
+        for fid in closures[target]:
+            holders.setdefault(fid, set()).add(best)
+
+    clusters.sort(key=lambda cluster: min(order[t] for t in cluster))
+    for cluster in clusters:
+        cluster.sort(key=lambda t: (int(inst.deadline[inst.fileIds[t]]), -int(inst.points[inst.fileIds[t]]), order[t]))
+    return clusters
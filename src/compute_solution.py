@@ -1,25 +1,204 @@
 #!/usr/bin/env python
-from instance import * 
+from instance import *
 from solution import *
 import os
+import sys
+import time
+import signal
+import argparse
+import resource
+import multiprocessing as mp
 from solver import solve_instance
+from subcache import SubInstanceCache
+from checkpoint import Checkpoint
+from incremental import resolve_instance
+from portfolio import solve_portfolio
+import telemetry
 
 instances_paths = ['./instances/', './bigger_instances/']
 solution_path = './solution/'
 
+def run_instance(in_path: str, out_path: str, options: argparse.Namespace, conn):
+	"""
+	Solves a single instance (in a worker process) and sends back [score, seconds, peak RSS in MB, peak RSS
+	of the largest of its own worker processes in MB]. The process starts a new process group, so that
+	run_batch can stop it together with the worker processes it starts (see --solver-workers).
+	options holds the command-line options (see the parser below); those used here are:
+		- solver_workers: worker processes solving the sub-instances
+		- cache, cache_size: directory and size of the persistent cache of solved sub-instances (see SubInstanceCache)
+		- instance_cache: whether the instance is loaded through its pre-parsed cache (see loadCachedInstance)
+		- solve_budget: time the solver schedules its MIP runs to fit in, in seconds
+		- improve_seconds, improve_iterations: limits of the local search run on the merged solution (None to skip it)
+		- cluster_threshold: targets with overlapping closures are solved together (see cluster_targets)
+		- stream_window: sub-instances are solved and merged one at a time (see solve_stream)
+		- checkpoint_interval: the progress is saved that often to out_path (best schedule so far) and to
+		  <out_path>.state, and a run killed before the end is resumed from there by the next one (see Checkpoint)
+		- previous_instances: if it holds the previous version of the instance (same file name) and out_path its
+		  solution, only the targets affected by the changes are solved again (see resolve_instance)
+		- full_fallback: with previous_instances, the instance is also solved from scratch and the better schedule kept
+		- portfolio, portfolio_seconds, portfolio_seed: the best of solve_instance and of that many variants of the
+		  heuristic, run by solver_workers processes, is kept (see solve_portfolio)
+		- trace_dir: the telemetry of the run is written there as <instance>.jsonl and <instance>.trace.json
+		- workers: the output of the solver is hidden when instances are solved in parallel
+	The solution is written to a temporary file first and then atomically renamed to out_path.
+	"""
+	os.setsid()
+	if options.workers > 1:
+		sys.stdout = open(os.devnull, 'w')
+	if options.trace_dir is not None:
+		name = os.path.basename(in_path).replace('.in', '')
+		telemetry.configure(os.path.join(options.trace_dir, f'{name}.jsonl'), os.path.join(options.trace_dir, f'{name}.trace.json'))
+	start = time.time()
+	with telemetry.span('load', instance=in_path):
+		instance = loadCachedInstance(in_path) if options.instance_cache else loadInstance(in_path)
+	cache = SubInstanceCache(options.cache, options.cache_size) if options.cache is not None else None
+	checkpoint = None
+	if options.checkpoint_interval is not None:
+		fingerprint = {'input': fileDigest(in_path), 'cluster_threshold': options.cluster_threshold}
+		checkpoint = Checkpoint(out_path, fingerprint, options.checkpoint_interval)
+	previous_path = os.path.join(options.previous_instances, os.path.basename(in_path)) if options.previous_instances is not None else None
+	if previous_path is not None and os.path.exists(previous_path) and os.path.exists(out_path):
+		old_instance = loadInstance(previous_path)
+		solution = resolve_instance(old_instance, loadSolution(out_path, old_instance), instance, workers=options.solver_workers,
+			cache=cache, budget=options.solve_budget, improve_seconds=options.improve_seconds, improve_iterations=options.improve_iterations,
+			full_fallback=options.full_fallback)
+	elif options.portfolio is not None:
+		solution = solve_portfolio(instance, options.portfolio, workers=options.solver_workers, seconds=options.portfolio_seconds, seed=options.portfolio_seed,
+			cache=cache, budget=options.solve_budget, improve_seconds=options.improve_seconds, improve_iterations=options.improve_iterations)
+	else:
+		solution = solve_instance(instance, workers=options.solver_workers, cache=cache, budget=options.solve_budget,
+			improve_seconds=options.improve_seconds, improve_iterations=options.improve_iterations, cluster_threshold=options.cluster_threshold,
+			stream_window=options.stream_window, checkpoint=checkpoint)
+	tmp_path = f'{out_path}.tmp'
+	solution.printSolution(tmp_path)
+	solution_from_file = loadSolution(tmp_path, instance)
+	with telemetry.span('evalCheck', instance=instance.name) as sp:
+		instance_score = solution_from_file.evalCheck(instance)
+		sp.set(score=instance_score)
+	os.replace(tmp_path, out_path)
+	if checkpoint is not None:
+		checkpoint.finish()
+	telemetry.shutdown()
+	peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+	worker_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024	# the worker pools are shut down by now
+	conn.send([instance_score, time.time() - start, peak_rss, worker_rss])
+	conn.close()
+
+def kill_job(proc: mp.Process):
+	"""
+	Stops a job started by run_batch together with its worker processes (its process group, see run_instance).
+	"""
+	try:
+		os.killpg(proc.pid, signal.SIGTERM)
+	except ProcessLookupError:
+		# the job did not get to start its process group, or it is gone with all its workers already
+		if proc.is_alive():
+			proc.terminate()
+	proc.join()
+
+def run_batch(jobs: "list[tuple[str, str]]", options: argparse.Namespace) -> "list[dict]":
+	"""
+	Solves the given (input path, output path) jobs in up to options.workers processes at a time, each of them
+	with the given command-line options (see run_instance).
+	A job still running after options.budget seconds is killed, with the worker processes it started, and reported
+	as timed out; its previous output (if any) is left untouched, unless options.checkpoint_interval is set (the
+	output is then the best schedule found so far, and the next run resumes the job).
+	Results are returned in the same order as jobs.
+	"""
+	results = [None] * len(jobs)
+	pending = list(range(len(jobs)))
+	running = {}
+	try:
+		while pending or running:
+			while pending and len(running) < options.workers:
+				idx = pending.pop(0)
+				recv_conn, send_conn = mp.Pipe(duplex=False)
+				proc = mp.Process(target=run_instance, args=(*jobs[idx], options, send_conn))
+				proc.start()
+				send_conn.close()
+				running[idx] = (proc, recv_conn, time.time())
+			for idx in list(running):
+				proc, recv_conn, start = running[idx]
+				if recv_conn.poll():
+					try:
+						score, elapsed, peak_rss, worker_rss = recv_conn.recv()
+						results[idx] = {'instance': jobs[idx][0], 'status': 'ok', 'score': score, 'time': elapsed, 'rss': peak_rss, 'worker_rss': worker_rss}
+					except EOFError:
+						results[idx] = {'instance': jobs[idx][0], 'status': 'failed', 'score': 0, 'time': time.time() - start, 'rss': 0, 'worker_rss': 0}
+					proc.join()
+					kill_job(proc)		# the worker processes a failed job may leave behind
+				elif not proc.is_alive():
+					kill_job(proc)
+					results[idx] = {'instance': jobs[idx][0], 'status': 'failed', 'score': 0, 'time': time.time() - start, 'rss': 0, 'worker_rss': 0}
+				elif options.budget is not None and time.time() - start > options.budget:
+					kill_job(proc)
+					results[idx] = {'instance': jobs[idx][0], 'status': 'timeout', 'score': 0, 'time': time.time() - start, 'rss': 0, 'worker_rss': 0}
+					if os.path.exists(f'{jobs[idx][1]}.tmp'):
+						os.remove(f'{jobs[idx][1]}.tmp')
+				else:
+					continue
+				recv_conn.close()
+				del running[idx]
+			if running:
+				time.sleep(0.05)
+	finally:
+		# e.g. on Ctrl-C, which the jobs do not get since they run in their own process groups
+		for proc, _, _ in running.values():
+			kill_job(proc)
+	return results
+
+def print_summary(results: "list[dict]"):
+	print(f'\n{"instance":<40} {"status":<8} {"score":>12} {"time [s]":>10} {"peak RSS [MB]":>14} {"worker RSS [MB]":>16}')
+	for r in results:
+		print(f'{r["instance"]:<40} {r["status"]:<8} {r["score"]:>12} {r["time"]:>10.1f} {r["rss"]:>14.1f} {r["worker_rss"]:>16.1f}')
+
 if __name__ == '__main__':
 
-	overall_score = 0
+	parser = argparse.ArgumentParser(description='Solve and evaluate all the instances.')
+	parser.add_argument('--workers', type=int, default=1, help='number of instances solved in parallel')
+	parser.add_argument('--budget', type=float, default=None, help='wall-clock limit per instance, in seconds')
+	parser.add_argument('--solver-workers', type=int, default=1, help='worker processes used within each instance')
+	parser.add_argument('--cache', default=None, help='directory of the persistent cache of solved sub-instances')
+	parser.add_argument('--cache-size', type=int, default=10000, help='maximum number of cached sub-instances')
+	parser.add_argument('--instance-cache', action='store_true', help='load the instances through pre-parsed <instance>.cache files')
+	parser.add_argument('--solve-budget', type=float, default=None, help='time the solver should take per instance, in seconds (MIP time is scheduled within it)')
+	parser.add_argument('--improve-seconds', type=float, default=None, help='time spent improving each solution by local search')
+	parser.add_argument('--improve-iterations', type=int, default=None, help='edits tried when improving each solution by local search')
+	parser.add_argument('--cluster-threshold', type=float, default=None, help='solve together the targets whose closures overlap (Jaccard similarity) more than this')
+	parser.add_argument('--stream-window', type=int, default=None, help='solve and merge the sub-instances one at a time, keeping at most this many solved ones waiting to be merged (bounded memory)')
+	parser.add_argument('--checkpoint-interval', type=float, default=None, help='save the progress of each instance this often (in seconds), resuming it on the next run if killed')
+	parser.add_argument('--previous-instances', default=None, help='directory with the previous version of the instances, whose solutions are the current outputs: only the targets affected by the changes are solved again')
+	parser.add_argument('--full-fallback', action='store_true', help='with --previous-instances, also solve each instance from scratch and keep the better schedule (as slow as a full run)')
+	parser.add_argument('--portfolio', type=int, default=None, help='also run this many variants of the heuristic (orderings and merge orders) on the solver workers, keeping the best schedule')
+	parser.add_argument('--portfolio-seconds', type=float, default=None, help='time limit of the variants of --portfolio, in seconds')
+	parser.add_argument('--portfolio-seed', type=int, default=0, help='seed of the random choices of the variants of --portfolio')
+	parser.add_argument('--trace-dir', default=None, help='directory where the telemetry of each instance is written (JSON lines and Chrome trace)')
+	args = parser.parse_args()
+	if args.stream_window is not None and args.solve_budget is not None:
+		parser.error('--stream-window can not be combined with --solve-budget')
+	if args.stream_window is not None and args.checkpoint_interval is not None:
+		parser.error('--stream-window can not be combined with --checkpoint-interval')
+	if args.previous_instances is not None and (args.stream_window is not None or args.checkpoint_interval is not None or args.cluster_threshold is not None):
+		parser.error('--previous-instances can not be combined with --stream-window, --checkpoint-interval or --cluster-threshold')
+	if args.full_fallback and args.previous_instances is None:
+		parser.error('--full-fallback requires --previous-instances')
+	if args.portfolio is not None and (args.stream_window is not None or args.checkpoint_interval is not None or args.cluster_threshold is not None or args.previous_instances is not None):
+		parser.error('--portfolio can not be combined with --stream-window, --checkpoint-interval, --cluster-threshold or --previous-instances')
+
+	jobs = []
 	for path in instances_paths:
 		instances_fns = os.listdir(path)
 
 		for fn in instances_fns:
-			instance = loadInstance(f'{path}{fn}')
-			solution = solve_instance(instance)
+			if not fn.endswith('.in'):
+				continue
 			fn_sol = fn.replace('.in', '.out')
-			solution.printSolution(f'{solution_path}{fn_sol}')
-			solution_from_file = loadSolution(f'{solution_path}{fn_sol}', instance)
-			instance_score = solution_from_file.evalCheck(instance)
-			overall_score = overall_score + instance_score
+			jobs.append((f'{path}{fn}', f'{solution_path}{fn_sol}'))
+
+	if args.trace_dir is not None:
+		os.makedirs(args.trace_dir, exist_ok=True)
+	results = run_batch(jobs, args)
+	print_summary(results)
+	overall_score = sum(r['score'] for r in results)
 
 	print(f'\nOverall score = {overall_score}')
@@ -0,0 +1,442 @@
+from heapq import heappush, heappop
+
+
+class DeltaEvaluator():
+    """
+    Incremental evaluator of a solution, used to score local edits ("move file X to server k",
+    "swap two steps", ...) without re-simulating the whole schedule.
+    Each edit only re-times the steps downstream of it (the rest of the affected server queues and
+    the compilations of the files depending on the edited ones) and returns the change in score.
+    Pending edits can then be kept with commit() or undone with rollback().
+    Timing follows the same rules as Solution.evalCheck.
+
+    Args:
+        instance (Instance): the instance the solution refers to
+        solution (Solution): the solution to start from (only its compSteps are used)
+    """
+
+    def __init__(self, instance, solution):
+        self.instance = instance
+        self.files = instance.files
+        self.nservers = instance.nservers
+        # per-step data, indexed by step ID
+        self.step_file = []
+        self.step_server = []
+        self.start = []
+        self.finish = []
+        self.round = []             # round of the checker's sweep the step is performed in (see Solution.evalCheck)
+        self.pos = []               # index of the step in its server queue, -1 once removed
+        self.queues = [[] for s in range(self.nservers)]
+        self.comps = {}             # file name -> IDs of the steps compiling it
+        self.ndups = 0              # number of files compiled more than once
+        self.rounds_valid = False   # whether the rounds are up to date (only needed while ndups > 0)
+        self.dependents = {}        # file name -> names of the files directly depending on it
+        for fname in self.files:
+            for dep in self.files[fname].dependencies:
+                self.dependents.setdefault(dep, []).append(fname)
+        for s in range(self.nservers):
+            for fname in solution.compSteps[s]:
+                sid = self._new_step(fname, s)
+                self.pos[sid] = len(self.queues[s])
+                self.queues[s].append(sid)
+        self.journal = []
+        self.before = {}            # contributions to the score before the edit in progress
+        self.score = 0
+        if not self._simulate():
+            raise ValueError('Deadlock in the solution')
+        self.journal = []
+
+    def _new_step(self, fname: str, server: int) -> int:
+        sid = len(self.step_file)
+        self.step_file.append(fname)
+        self.step_server.append(server)
+        self.start.append(0)
+        self.finish.append(0)
+        self.round.append(0)
+        self.pos.append(-1)
+        self._add_comp(fname, sid)
+        return sid
+
+    def _add_comp(self, fname: str, sid: int):
+        comps = self.comps.setdefault(fname, [])
+        comps.append(sid)
+        self.ndups += len(comps) == 2
+
+    def _remove_comp(self, fname: str, sid: int):
+        comps = self.comps[fname]
+        comps.remove(sid)
+        self.ndups -= len(comps) == 1
+
+    def _refresh_pos(self, server: int, idx: int):
+        queue = self.queues[server]
+        for i in range(idx, len(queue)):
+            self.pos[queue[i]] = i
+
+    def _queue_insert(self, server: int, idx: int, sid: int):
+        self.queues[server].insert(idx, sid)
+        self.step_server[sid] = server
+        self._refresh_pos(server, idx)
+        self.journal.append(('insert', server, idx, sid))
+
+    def _queue_remove(self, server: int, idx: int) -> int:
+        sid = self.queues[server].pop(idx)
+        self.pos[sid] = -1
+        self._refresh_pos(server, idx)
+        self.journal.append(('remove', server, idx, sid))
+        return sid
+
+    def _set_time(self, sid: int, rnd: int, start: int):
+        fname = self.step_file[sid]
+        if fname not in self.before:
+            self.before[fname] = self.file_contribution(fname)
+        self.journal.append(('time', sid, self.round[sid], self.start[sid], self.finish[sid]))
+        self.round[sid] = rnd
+        self.start[sid] = start
+        self.finish[sid] = start + self.files[self.step_file[sid]].ctime
+
+    def _key(self, sid: int):
+        return (self.round[sid], self.step_server[sid])
+
+    def avail_time(self, fname: str, server: int, before=None):
+        """
+        Returns the time file fname is available at server (None if it is never compiled), only counting
+        the compilations performed before the (round, server) before if given.
+        """
+        best = None
+        rtime = self.files[fname].rtime
+        for sid in self.comps.get(fname, []):
+            if before is not None and self._key(sid) >= before:
+                continue
+            t = self.finish[sid] if self.step_server[sid] == server else self.finish[sid] + rtime
+            if best is None or t < best:
+                best = t
+        return best
+
+    def file_contribution(self, fname: str) -> int:
+        """
+        Returns the points file fname is currently worth (0 unless it is a target compiled in time).
+        """
+        cf = self.files[fname]
+        if cf.points <= 0 or not self.comps.get(fname):
+            return 0
+        finish = min(self.finish[sid] for sid in self.comps[fname])
+        if finish > cf.deadline:
+            return 0
+        return cf.deadline - finish + cf.points
+
+    def _server_pred(self, sid: int):
+        idx = self.pos[sid]
+        return self.queues[self.step_server[sid]][idx - 1] if idx > 0 else None
+
+    def _server_succ(self, sid: int):
+        queue = self.queues[self.step_server[sid]]
+        idx = self.pos[sid]
+        return queue[idx + 1] if idx + 1 < len(queue) else None
+
+    def _timing(self, sid: int, rounds: bool = True):
+        """
+        Returns the (round, start time) of a step, from those of the steps before it, or None if a
+        dependency is never compiled. Unless rounds is set, the round is left as it is and all the
+        compilations of the dependencies are counted (the same thing when each file is compiled once).
+        """
+        server = self.step_server[sid]
+        pred = self._server_pred(sid)
+        start = self.finish[pred] if pred is not None else 0
+        deps = self.files[self.step_file[sid]].dependencies
+        if not rounds:
+            for dep in deps:
+                t = self.avail_time(dep, server)
+                if t is None:
+                    return None
+                start = max(start, t)
+            return self.round[sid], start
+        rnd = self.round[pred] + 1 if pred is not None else 0
+        for dep in deps:
+            if not self.comps.get(dep):
+                return None
+            dep_round, dep_server = min(self._key(c) for c in self.comps[dep])
+            rnd = max(rnd, dep_round + (dep_server > server))
+        for dep in deps:
+            start = max(start, self.avail_time(dep, server, (rnd, server)))
+        return rnd, start
+
+    def _simulate(self) -> bool:
+        """
+        Re-times every step from scratch (event-driven, in the order of Solution.evalCheck).
+        Returns False if the schedule deadlocks.
+        """
+        self.journal.append(('snapshot', list(self.round), list(self.start), list(self.finish), self.score,
+                             self.rounds_valid))
+        nservers = self.nservers
+        next_step = [0] * nservers
+        done = set()
+        missing = [0] * nservers
+        waiting = {}
+        ready = []
+        free = [0] * nservers
+        last_round = [-1] * nservers
+
+        def head_start(s):
+            sid = self.queues[s][next_step[s]]
+            start = free[s]
+            for dep in self.files[self.step_file[sid]].dependencies:
+                rtime = self.files[dep].rtime
+                start = max(start, min(self.finish[c] if self.step_server[c] == s else self.finish[c] + rtime
+                                       for c in self.comps[dep] if c in done))
+            return start
+
+        def head_round(s):
+            sid = self.queues[s][next_step[s]]
+            rnd = last_round[s] + 1
+            for dep in self.files[self.step_file[sid]].dependencies:
+                dep_round, dep_server = min(self._key(c) for c in self.comps[dep] if c in done)
+                rnd = max(rnd, dep_round + (dep_server > s))
+            return rnd
+
+        def enqueue(s):
+            if next_step[s] >= len(self.queues[s]):
+                return
+            sid = self.queues[s][next_step[s]]
+            count = 0
+            for dep in self.files[self.step_file[sid]].dependencies:
+                if not any(c in done for c in self.comps.get(dep, [])):
+                    count += 1
+                    waiting.setdefault(dep, []).append(s)
+            missing[s] = count
+            if count == 0:
+                heappush(ready, (head_round(s), s))
+
+        for s in range(nservers):
+            enqueue(s)
+        while ready:
+            rnd, s = heappop(ready)
+            sid = self.queues[s][next_step[s]]
+            fname = self.step_file[sid]
+            start = head_start(s)
+            self.round[sid] = rnd
+            last_round[s] = rnd
+            self.start[sid] = start
+            self.finish[sid] = start + self.files[fname].ctime
+            free[s] = self.finish[sid]
+            first = not any(c in done for c in self.comps[fname])
+            done.add(sid)
+            next_step[s] += 1
+            if first:
+                for other in waiting.pop(fname, []):
+                    missing[other] -= 1
+                    if missing[other] == 0:
+                        heappush(ready, (head_round(other), other))
+            enqueue(s)
+
+        if any(next_step[s] < len(self.queues[s]) for s in range(nservers)):
+            return False
+        self.rounds_valid = True
+        self.score = sum(self.file_contribution(fname) for fname in self.comps)
+        return True
+
+    def _propagate(self, seeds, moved=()) -> bool:
+        """
+        Re-times the steps downstream of seeds, in topological order, only recomputing a step
+        when one of its predecessors changed (moved steps always count as changed, since their
+        availability at the other servers depends on where they are compiled).
+        The rounds only decide which compilations of a file compiled more than once a step can use: while
+        there are none, they are not kept up to date, and the first edit adding one re-simulates everything.
+        Returns False if the schedule deadlocks.
+        """
+        rounds = self.ndups > 0
+        if rounds and not self.rounds_valid:
+            return self._simulate()
+        if not rounds and self.rounds_valid:
+            self.journal.append(('rounds_valid', True))
+            self.rounds_valid = False
+        seeds = set(sid for sid in seeds if sid is not None and self.pos[sid] >= 0)
+        # collect the affected cone
+        cone = set(seeds)
+        stack = list(seeds)
+        while stack:
+            sid = stack.pop()
+            succ = [self._server_succ(sid)]
+            for dependent in self.dependents.get(self.step_file[sid], []):
+                succ.extend(self.comps.get(dependent, []))
+            for other in succ:
+                if other is not None and other not in cone:
+                    cone.add(other)
+                    stack.append(other)
+
+        # topologically re-time the cone
+        preds = {}
+        indeg = {}
+        for sid in cone:
+            p = [self._server_pred(sid)]
+            for dep in self.files[self.step_file[sid]].dependencies:
+                if not self.comps.get(dep):
+                    return False
+                p.extend(self.comps[dep])
+            preds[sid] = [x for x in p if x is not None and x in cone]
+            indeg[sid] = len(preds[sid])
+        succs = {}
+        for sid in cone:
+            for p in preds[sid]:
+                succs.setdefault(p, []).append(sid)
+        queue = [sid for sid in cone if indeg[sid] == 0]
+        changed = set(moved)
+        processed = 0
+        while queue:
+            sid = queue.pop()
+            processed += 1
+            if sid in seeds or any(p in changed for p in preds[sid]):
+                timing = self._timing(sid, rounds)
+                if timing is None:
+                    return False
+                rnd, start = timing
+                if rnd != self.round[sid] or start != self.start[sid] \
+                        or self.finish[sid] != start + self.files[self.step_file[sid]].ctime:
+                    self._set_time(sid, rnd, start)
+                    changed.add(sid)
+            for other in succs.get(sid, []):
+                indeg[other] -= 1
+                if indeg[other] == 0:
+                    queue.append(other)
+
+        if processed < len(cone):
+            # a cycle through the cone: it might only involve redundant duplicate compilations,
+            # so let the full simulation decide
+            return self._simulate()
+        return True
+
+    def move(self, server: int, idx: int, to_server: int, to_idx: int):
+        """
+        Moves the step at position idx of server to position to_idx of to_server
+        (to_idx refers to the queue of to_server after the step has been removed).
+        Returns the change in score, or None (and nothing is changed) if the schedule becomes infeasible.
+        """
+        mark = len(self.journal)
+        fname = self.step_file[self.queues[server][idx]]
+        self.before = {fname: self.file_contribution(fname)}
+        sid = self._queue_remove(server, idx)
+        succ_old = self.queues[server][idx] if idx < len(self.queues[server]) else None
+        self._queue_insert(to_server, to_idx, sid)
+        return self._edit(mark, [sid, succ_old, self._server_succ(sid)], [sid])
+
+    def swap(self, server: int, i: int, j: int):
+        """
+        Swaps the steps at positions i and j of server.
+        Returns the change in score, or None (and nothing is changed) if the schedule becomes infeasible.
+        """
+        if i == j:
+            return 0
+        i, j = min(i, j), max(i, j)
+        mark = len(self.journal)
+        a, b = self.queues[server][i], self.queues[server][j]
+        self.before = {f: self.file_contribution(f) for f in (self.step_file[a], self.step_file[b])}
+        self._queue_remove(server, j)
+        self._queue_remove(server, i)
+        self._queue_insert(server, i, b)
+        self._queue_insert(server, j, a)
+        return self._edit(mark, [a, b, self._server_succ(a), self._server_succ(b)])
+
+    def insert(self, fname: str, server: int, idx: int):
+        """
+        Adds a compilation of file fname at position idx of server (e.g. a duplicate compilation).
+        Returns the change in score, or None (and nothing is changed) if the schedule becomes infeasible.
+        """
+        mark = len(self.journal)
+        self.before = {fname: self.file_contribution(fname)}
+        sid = self._new_step(fname, server)
+        self.journal.append(('comp_add', fname, sid))
+        self._queue_insert(server, idx, sid)
+        return self._edit(mark, [sid, self._server_succ(sid)], [sid])
+
+    def remove(self, server: int, idx: int):
+        """
+        Removes the step at position idx of server.
+        Returns the change in score, or None (and nothing is changed) if the schedule becomes infeasible.
+        """
+        mark = len(self.journal)
+        sid = self.queues[server][idx]
+        fname = self.step_file[sid]
+        self.before = {fname: self.file_contribution(fname)}
+        self._queue_remove(server, idx)
+        self._remove_comp(fname, sid)
+        self.journal.append(('comp_remove', fname, sid))
+        seeds = [self.queues[server][idx] if idx < len(self.queues[server]) else None]
+        for dependent in self.dependents.get(fname, []):
+            seeds.extend(self.comps.get(dependent, []))
+        return self._edit(mark, seeds)
+
+    def _edit(self, mark: int, seeds, moved=()):
+        old_score = self.score
+        ok = self._propagate(seeds, moved)
+        before, self.before = self.before, {}
+        if not ok:
+            self.rollback(mark)
+            return None
+        if any(entry[0] == 'snapshot' for entry in self.journal[mark:]):
+            # the whole schedule was re-simulated and the score recomputed
+            return self.score - old_score
+        self.journal.append(('score', self.score))
+        for fname, contribution in before.items():
+            self.score += self.file_contribution(fname) - contribution
+        return self.score - old_score
+
+    def commit(self):
+        """
+        Keeps all the pending edits.
+        """
+        self.journal = []
+
+    def rollback(self, mark: int = 0):
+        """
+        Undoes all the pending edits (or only those made after journal position mark).
+        """
+        dirty = set()
+        while len(self.journal) > mark:
+            entry = self.journal.pop()
+            kind = entry[0]
+            if kind == 'time':
+                _, sid, rnd, start, finish = entry
+                self.round[sid] = rnd
+                self.start[sid] = start
+                self.finish[sid] = finish
+            elif kind == 'score':
+                self.score = entry[1]
+            elif kind == 'snapshot':
+                _, rnd, start, finish, score, self.rounds_valid = entry
+                self.round[:len(rnd)] = rnd
+                self.start[:len(start)] = start
+                self.finish[:len(finish)] = finish
+                self.score = score
+            elif kind == 'insert':
+                _, server, idx, sid = entry
+                self.queues[server].pop(idx)
+                self.pos[sid] = -1
+                dirty.add(server)
+            elif kind == 'remove':
+                _, server, idx, sid = entry
+                self.queues[server].insert(idx, sid)
+                self.step_server[sid] = server
+                dirty.add(server)
+            elif kind == 'comp_add':
+                self._remove_comp(entry[1], entry[2])
+            elif kind == 'comp_remove':
+                self._add_comp(entry[1], entry[2])
+            elif kind == 'rounds_valid':
+                self.rounds_valid = entry[1]
+        for server in dirty:
+            self._refresh_pos(server, 0)
+
+    def steps(self, server: int) -> "list[str]":
+        """
+        Returns the names of the files compiled at server, in order.
+        """
+        return [self.step_file[sid] for sid in self.queues[server]]
+
+    def to_solution(self, solution_cls):
+        """
+        Builds a solution_cls (i.e. Solution) holding the current schedule.
+        """
+        solution = solution_cls(self.nservers)
+        scheduled = sorted((self.start[sid], s, sid) for s in range(self.nservers) for sid in self.queues[s])
+        for start, s, sid in scheduled:
+            solution.recordNewCompilation(self.instance, start, s, self.step_file[sid])
+        return solution
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+import os
+import math
+import random
+import argparse
+
+MAX_FILES = 100000
+MAX_SERVERS = 100
+
+# name -> keyword arguments of generate_instance
+PRESETS = {
+    'tiny':         dict(nfiles=100, ntargets=5, nservers=2, depth=5, fan_in=3),
+    'small':        dict(nfiles=1000, ntargets=20, nservers=4, depth=10, fan_in=3),
+    'medium':       dict(nfiles=10000, ntargets=100, nservers=10, depth=20, fan_in=4),
+    'large':        dict(nfiles=50000, ntargets=500, nservers=50, depth=30, fan_in=5),
+    'max':          dict(nfiles=MAX_FILES, ntargets=1000, nservers=MAX_SERVERS, depth=40, fan_in=5),
+    'deep':         dict(nfiles=10000, ntargets=50, nservers=10, depth=500, fan_in=2),
+    'wide':         dict(nfiles=10000, ntargets=500, nservers=10, depth=3, fan_in=8),
+    'tight':        dict(nfiles=10000, ntargets=100, nservers=10, depth=20, fan_in=4, tightness=1.05),
+    'heavy-tailed': dict(nfiles=10000, ntargets=100, nservers=10, depth=20, fan_in=4,
+                         ctime=(1, 10000), rtime=(1, 100000), distribution='loguniform'),
+}
+# presets making up the benchmarking sweep, from the smallest to the largest
+SWEEP = ['tiny', 'small', 'medium', 'deep', 'wide', 'tight', 'heavy-tailed', 'large', 'max']
+
+
+def file_name(idx: int) -> str:
+    """
+    Returns the name of the idx-th file: 'f' followed by idx in base 36.
+    """
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    name = ''
+    while True:
+        idx, rem = divmod(idx, 36)
+        name = digits[rem] + name
+        if idx == 0:
+            return 'f' + name
+
+
+def draw(rng: random.Random, bounds: "tuple[int, int]", distribution: str) -> int:
+    lo, hi = bounds
+    if distribution == 'uniform':
+        return rng.randint(lo, hi)
+    assert(distribution == 'loguniform')
+    return min(hi, max(lo, int(math.exp(rng.uniform(math.log(lo), math.log(hi + 1))))))
+
+
+def generate_instance(out_path: str, nfiles: int, ntargets: int, nservers: int, depth: int = 10, fan_in: int = 3,
+                      locality: float = 0.8, ctime: "tuple[int, int]" = (1, 100), rtime: "tuple[int, int]" = (1, 100),
+                      distribution: str = 'uniform', tightness: float = 1.5, points: "tuple[int, int]" = (1, 100),
+                      seed: int = 0):
+    """
+    Writes a random instance to out_path. The files are spread over depth layers, each file (but those of the
+    first layer) depending on 1 to fan_in files of earlier layers: of the previous layer with probability
+    locality, of any earlier layer otherwise. Targets are picked among the files of the last layers. The
+    deadline of each of them is tightness times the larger of its longest chain of compilations and the
+    work of all the files generated before it spread over the servers (which is at least the work of its closure).
+    The file is written as it is generated: only the longest chain and the cumulative work at each file are
+    kept in memory.
+    The same arguments (seed included) always give the same instance.
+
+    Args:
+        out_path (str): where to write the instance
+        nfiles (int): number of files (at most 100000)
+        ntargets (int): number of targets (at most nfiles)
+        nservers (int): number of servers (at most 100)
+        depth (int): number of layers of the dependency DAG
+        fan_in (int): maximum number of dependencies of a file
+        locality (float): probability of a dependency being taken from the previous layer
+        ctime (tuple[int, int]): range of the compilation times
+        rtime (tuple[int, int]): range of the replication times
+        distribution (str): distribution of compilation and replication times, 'uniform' or 'loguniform'
+        tightness (float): ratio between the deadline of a target and the time it could be compiled by
+        points (tuple[int, int]): range of the points of the targets
+        seed (int): seed of the random generator
+    """
+    assert(1 <= nfiles <= MAX_FILES and 1 <= ntargets <= nfiles and 1 <= nservers <= MAX_SERVERS)
+    depth = max(1, min(depth, nfiles))
+    rng = random.Random(seed)
+    layer_start = [l * nfiles // depth for l in range(depth + 1)]
+    chain = [0] * nfiles
+    work = [0] * (nfiles + 1)   # total compilation time of the files before each one
+    with open(out_path, 'w') as fp:
+        fp.write(f'{nfiles} {ntargets} {nservers}\n')
+        lines = []
+        for layer in range(depth):
+            for idx in range(layer_start[layer], layer_start[layer + 1]):
+                deps = set()
+                if layer > 0:
+                    for _ in range(rng.randint(1, fan_in)):
+                        if rng.random() < locality:
+                            deps.add(rng.randrange(layer_start[layer - 1], layer_start[layer]))
+                        else:
+                            deps.add(rng.randrange(0, layer_start[layer]))
+                c = draw(rng, ctime, distribution)
+                r = draw(rng, rtime, distribution)
+                chain[idx] = c + max((chain[d] for d in deps), default=0)
+                work[idx + 1] = work[idx] + c
+                lines.append(f'{file_name(idx)} {c} {r}\n')
+                lines.append(' '.join([str(len(deps))] + [file_name(d) for d in sorted(deps)]) + '\n')
+                if len(lines) >= 8192:
+                    fp.write(''.join(lines))
+                    lines = []
+        fp.write(''.join(lines))
+        # targets among the last layers (the last quarter of the files, or more if needed)
+        first = max(0, min(nfiles - ntargets, nfiles - max(1, nfiles // 4)))
+        for idx in sorted(rng.sample(range(first, nfiles), ntargets)):
+            deadline = max(1, int(max(chain[idx], work[idx + 1] // nservers) * tightness))
+            fp.write(f'{file_name(idx)} {deadline} {rng.randint(*points)}\n')
+
+
+def generate_preset(name: str, out_path: str, seed: int = 0):
+    generate_instance(out_path, seed=seed, **PRESETS[name])
+
+
+def parse_range(text: str) -> "tuple[int, int]":
+    lo, hi = text.split(':')
+    return (int(lo), int(hi))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Generate random instances.')
+    parser.add_argument('output', help='output file (or directory, with --sweep)')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default=None, help='start from the parameters of a preset')
+    parser.add_argument('--sweep', action='store_true', help=f'write all the presets of the sweep ({", ".join(SWEEP)}) to the output directory')
+    parser.add_argument('--files', type=int, default=None, help='number of files')
+    parser.add_argument('--targets', type=int, default=None, help='number of targets')
+    parser.add_argument('--servers', type=int, default=None, help='number of servers')
+    parser.add_argument('--depth', type=int, default=None, help='number of layers of the dependency DAG')
+    parser.add_argument('--fan-in', type=int, default=None, help='maximum number of dependencies of a file')
+    parser.add_argument('--locality', type=float, default=None, help='probability of depending on the previous layer')
+    parser.add_argument('--ctime', type=parse_range, default=None, help='range of the compilation times, as MIN:MAX')
+    parser.add_argument('--rtime', type=parse_range, default=None, help='range of the replication times, as MIN:MAX')
+    parser.add_argument('--distribution', choices=['uniform', 'loguniform'], default=None, help='distribution of the times')
+    parser.add_argument('--tightness', type=float, default=None, help='deadline of a target over the time it could be compiled by')
+    parser.add_argument('--points', type=parse_range, default=None, help='range of the points of the targets, as MIN:MAX')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+    args = parser.parse_args()
+
+    if args.sweep:
+        os.makedirs(args.output, exist_ok=True)
+        for name in SWEEP:
+            generate_preset(name, os.path.join(args.output, f'{name}.in'), args.seed)
+    else:
+        params = dict(PRESETS[args.preset]) if args.preset is not None else dict(nfiles=1000, ntargets=20, nservers=4)
+        overrides = {'nfiles': args.files, 'ntargets': args.targets, 'nservers': args.servers, 'depth': args.depth,
+                     'fan_in': args.fan_in, 'locality': args.locality, 'ctime': args.ctime, 'rtime': args.rtime,
+                     'distribution': args.distribution, 'tightness': args.tightness, 'points': args.points}
+        params.update({key: value for key, value in overrides.items() if value is not None})
+        generate_instance(args.output, seed=args.seed, **params)
@@ -0,0 +1,93 @@
+import numpy as np
+from instance import *
+from solution import *
+
+
+def independent_runs(deps: "list[list[int]]") -> "list[tuple[int, int]]":
+    """
+    Splits positions 0..len(deps)-1 (topologically sorted) into maximal runs [start, end) of consecutive
+    positions none of which depends on another position of the same run.
+    """
+    runs = []
+    start = 0
+    for pos in range(len(deps)):
+        if any(d >= start for d in deps[pos]):
+            runs.append((start, pos))
+            start = pos
+    if len(deps) > start:
+        runs.append((start, len(deps)))
+    return runs
+
+
+def vectorized_list_schedule(sub_instance: SubInstance) -> Solution:
+    """
+    Array-based version of the greedy list scheduling of heuristically_solve_sub_instance: files are
+    placed in the order of filesList, each on the server where it can start first (the lowest index on ties),
+    and the resulting schedule is the same.
+    The time each file's dependencies are available at every server is computed as a matrix, in one batch
+    for each run of consecutive files independent of each other. The gaps of the servers are mirrored in a
+    (servers x gaps) matrix, so that the start time of a file at every server (the first gap starting after
+    its dependencies are available and long enough to hold it, or else the end of the server's last step)
+    is found with a few array operations; only the row of the chosen server changes after each placement.
+
+    Args:
+        sub_instance (SubInstance): the sub-instance to be solved, with a topologically sorted filesList
+    """
+    nservers = sub_instance.nservers
+    files = sub_instance.filesList
+    nfiles = len(files)
+    solution = Solution(nservers)
+    intervals = solution.freeIntervals
+    deps = [[sub_instance.filesIdx[dep] for dep in cf.dependencies] for cf in files]
+    ctimes = [cf.ctime for cf in files]
+    rtime = np.array([cf.rtime for cf in files], dtype=np.int64)
+    ndeps = np.array([len(d) for d in deps], dtype=np.int64)
+    dep_ptr = np.concatenate([[0], np.cumsum(ndeps)])        # dependencies of position i: dep_idx[dep_ptr[i]:dep_ptr[i + 1]]
+    dep_idx = np.array([d for ds in deps for d in ds], dtype=np.int64)
+    finish = np.zeros(nfiles, dtype=np.int64)
+    server = np.zeros(nfiles, dtype=np.int64)
+    tail = np.zeros(nservers, dtype=np.int64)                 # end of the last step of each server
+    gap_start = np.zeros((nservers, 4), dtype=np.int64)       # gaps of each server, padded with empty ones
+    gap_len = np.zeros((nservers, 4), dtype=np.int64)
+    longest = 0                                               # longest gap of any server
+    never = np.iinfo(np.int64).max
+
+    for start, end in independent_runs(deps):
+        # availability of the dependencies of each file of the run at each server: the row-wise maximum over
+        # its dependencies of their finish time at the server they are compiled at, plus replication elsewhere
+        lo, hi = dep_ptr[start], dep_ptr[end]
+        if lo < hi:
+            # (with a row of zeros at the end, since files without dependencies make empty groups)
+            pair_deps = dep_idx[lo:hi]
+            values = np.zeros((hi - lo + 1, nservers), dtype=np.int64)
+            values[:-1] = (finish[pair_deps] + rtime[pair_deps])[:, None]
+            values[np.arange(hi - lo), server[pair_deps]] = finish[pair_deps]
+            avail = np.maximum.reduceat(values, dep_ptr[start:end] - lo, axis=0)
+            avail[ndeps[start:end] == 0] = 0
+        else:
+            avail = np.zeros((end - start, nservers), dtype=np.int64)
+
+        for r in range(end - start):
+            pos = start + r
+            length = ctimes[pos]
+            ready = avail[r]
+            starts = np.maximum(ready, tail)
+            if longest > length:
+                fits = (gap_start >= ready[:, None]) & (gap_len > length)
+                np.minimum(starts, np.where(fits, gap_start, never).min(axis=1), out=starts)
+            s = starts.argmin().item()
+            sched_time = starts[s].item()
+            solution.recordNewCompilation(sub_instance, sched_time, s, files[pos].name)
+            finish[pos] = sched_time + length
+            server[pos] = s
+            fi = intervals[s]
+            tail[s] = fi.tail
+            if len(fi) > gap_start.shape[1]:
+                gap_start = np.hstack([gap_start, np.zeros_like(gap_start)])
+                gap_len = np.hstack([gap_len, np.zeros_like(gap_len)])
+            if len(fi):
+                gap_start[s, :len(fi)] = fi.starts
+                gap_len[s, :len(fi)] = np.subtract(fi.ends, fi.starts)
+                longest = max(longest, fi.longest_gap())
+
+    return solution
@@ -0,0 +1,182 @@
+import time
+import random
+from instance import *
+from solution import *
+from closure import ClosureIndex
+from bounds import CriticalPathBounds
+from evaluator import DeltaEvaluator
+import telemetry
+
+
+class LocalSearch():
+    """
+    Hill climbing on a complete schedule, each candidate edit being scored by a DeltaEvaluator.
+    The neighbourhood is made of:
+        - relocate: move a step to another server, at about the same time
+        - reorder: swap two nearby steps of a server
+        - reinsert: compile a target left out of the schedule (with the files of its closure not compiled
+          anywhere yet), appending each file to the server where it can start first
+        - duplicate: compile again, right before a step, a dependency it receives from another server,
+          to save its replication time
+    Edits which improve the score are kept; relocations and swaps which leave it unchanged are also
+    kept with probability accept_equal, to move across plateaus.
+
+    Args:
+        instance (Instance): the instance the solution refers to
+        solution (Solution): the schedule to improve
+        seed (int): seed of the random choices
+        accept_equal (float): probability of keeping a score-neutral relocation or swap
+    """
+
+    MOVES = ['relocate', 'reorder', 'reinsert', 'duplicate']
+    WEIGHTS = [0.35, 0.35, 0.15, 0.15]
+
+    def __init__(self, instance, solution: Solution, seed: int = 0, accept_equal: float = 0.2):
+        self.instance = instance
+        self.evaluator = DeltaEvaluator(instance, solution)
+        self.rng = random.Random(seed)
+        self.accept_equal = accept_equal
+        self.closure_index = ClosureIndex(instance)
+        bounds = CriticalPathBounds(self.closure_index)
+        self.targets = [t for t in instance.targets
+                        if not bounds.hopeless(self.closure_index.instance.fileIds[t])]
+        self.accepted = {move: 0 for move in self.MOVES}
+        self.tried = {move: 0 for move in self.MOVES}
+
+    @property
+    def score(self) -> int:
+        return self.evaluator.score
+
+    def _position_at(self, server: int, t: int) -> int:
+        """
+        Returns the position of the first step of server starting at or after t.
+        """
+        ev = self.evaluator
+        queue = ev.queues[server]
+        lo, hi = 0, len(queue)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ev.start[queue[mid]] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _random_step(self):
+        ev = self.evaluator
+        servers = [s for s in range(ev.nservers) if ev.queues[s]]
+        if not servers:
+            return None
+        server = self.rng.choice(servers)
+        return [server, self.rng.randrange(len(ev.queues[server]))]
+
+    def _keep(self, delta, neutral_ok: bool) -> bool:
+        ev = self.evaluator
+        if delta is None:
+            return False
+        if delta > 0 or (delta == 0 and neutral_ok and self.rng.random() < self.accept_equal):
+            ev.commit()
+            return True
+        ev.rollback()
+        return False
+
+    def relocate(self) -> bool:
+        ev = self.evaluator
+        picked = self._random_step()
+        if picked is None or ev.nservers < 2:
+            return False
+        server, idx = picked
+        to_server = self.rng.choice([s for s in range(ev.nservers) if s != server])
+        to_idx = self._position_at(to_server, ev.start[ev.queues[server][idx]])
+        return self._keep(ev.move(server, idx, to_server, to_idx), True)
+
+    def reorder(self) -> bool:
+        ev = self.evaluator
+        picked = self._random_step()
+        if picked is None or len(ev.queues[picked[0]]) < 2:
+            return False
+        server, i = picked
+        j = min(max(i + self.rng.choice([-3, -2, -1, 1, 2, 3]), 0), len(ev.queues[server]) - 1)
+        return self._keep(ev.swap(server, i, j), True)
+
+    def reinsert(self) -> bool:
+        ev = self.evaluator
+        dropped = [t for t in self.targets if not ev.comps.get(t)]
+        if not dropped:
+            return False
+        target = self.rng.choice(dropped)
+        names = self.closure_index.instance.names
+        missing = [names[fid] for fid in self.closure_index.closure(self.closure_index.instance.fileIds[target])
+                   if not ev.comps.get(names[fid])]
+        delta = 0
+        for fname in missing:
+            # appended to the server where it can start first
+            ready = [max([ev.avail_time(dep, s) for dep in self.instance.files[fname].dependencies]
+                         + [ev.finish[ev.queues[s][-1]] if ev.queues[s] else 0]) for s in range(ev.nservers)]
+            server = ready.index(min(ready))
+            step_delta = ev.insert(fname, server, len(ev.queues[server]))
+            if step_delta is None:
+                ev.rollback()
+                return False
+            delta += step_delta
+        return self._keep(delta, False)
+
+    def duplicate(self) -> bool:
+        ev = self.evaluator
+        picked = self._random_step()
+        if picked is None:
+            return False
+        server, idx = picked
+        sid = ev.queues[server][idx]
+        # dependencies received from another server just in time for the step, largest replication first
+        candidates = []
+        for dep in self.instance.files[ev.step_file[sid]].dependencies:
+            if all(ev.step_server[d] != server for d in ev.comps.get(dep, [])) \
+                    and ev.avail_time(dep, server) == ev.start[sid]:
+                candidates.append((self.instance.files[dep].rtime, dep))
+        if not candidates:
+            return False
+        _, dep = max(candidates)
+        return self._keep(ev.insert(dep, server, idx), False)
+
+    def run(self, time_limit: float = None, max_iterations: int = None) -> int:
+        """
+        Applies random edits until time_limit seconds have passed or max_iterations edits have been
+        tried (at least one of the two must be given). Returns the final score.
+        """
+        assert(time_limit is not None or max_iterations is not None)
+        end = time.time() + time_limit if time_limit is not None else None
+        iteration = 0
+        while (max_iterations is None or iteration < max_iterations) and (end is None or time.time() < end):
+            move = self.rng.choices(self.MOVES, self.WEIGHTS)[0]
+            self.tried[move] += 1
+            if getattr(self, move)():
+                self.accepted[move] += 1
+            iteration += 1
+        return self.score
+
+    def solution(self) -> Solution:
+        return self.evaluator.to_solution(Solution)
+
+
+def improve_solution(instance, solution: Solution, time_limit: float = None, max_iterations: int = None,
+                     seed: int = 0) -> Solution:
+    """
+    Runs a LocalSearch on a solution for time_limit seconds or max_iterations edits, whichever comes first.
+    Returns the improved solution, or the given one if nothing better was found.
+
+    Args:
+        instance (Instance): the instance the solution refers to
+        solution (Solution): the solution to improve
+        time_limit (float): time limit of the search, in seconds
+        max_iterations (int): maximum number of edits tried
+        seed (int): seed of the random choices
+    """
+    with telemetry.span('improve', instance=instance.name) as sp:
+        search = LocalSearch(instance, solution, seed)
+        initial = search.score
+        final = search.run(time_limit, max_iterations)
+        sp.set(initial=initial, final=final, tried=search.tried, accepted=search.accepted)
+        if final <= initial:
+            return solution
+        return search.solution()
@@ -0,0 +1,158 @@
+from instance import *
+from solution import *
+from closure import ClosureIndex
+from bounds import CriticalPathBounds
+from evaluator import DeltaEvaluator
+from improve import improve_solution
+from concurrent.futures import ProcessPoolExecutor
+from solver import solve_instance, solve_sub_instance, solve_sub_instances_with_budget, merge_sub_instances, \
+    sub_instance_score
+from budget import TimeBudget
+import telemetry
+
+
+def instance_delta(old_instance, new_instance) -> "list[set]":
+    """
+    Returns [changed files, changed targets] between two versions of an instance: the files of the new
+    instance which are new or whose compilation time, replication time or dependencies changed, and the
+    targets of the new instance which are new or whose deadline or points changed.
+    """
+    old_files, new_files = old_instance.files, new_instance.files
+    changed = set()
+    for fname in new_files:
+        if fname not in old_files:
+            changed.add(fname)
+            continue
+        old, new = old_files[fname], new_files[fname]
+        if old.ctime != new.ctime or old.rtime != new.rtime or list(old.dependencies) != list(new.dependencies):
+            changed.add(fname)
+    old_targets = set(old_instance.targets)
+    changed_targets = set()
+    for target in new_instance.targets:
+        if target not in old_targets or old_files[target].deadline != new_files[target].deadline \
+                or old_files[target].points != new_files[target].points:
+            changed_targets.add(target)
+    return [changed, changed_targets]
+
+
+def affected_targets(closure_index: ClosureIndex, changed: set, changed_targets: set) -> "list[str]":
+    """
+    Returns the targets (in instance order) which changed or depend (transitively) on a changed file:
+    a file is marked dirty in a single pass over the dependency DAG in topological order.
+    """
+    inst = closure_index.instance
+    offsets, indices = closure_index.offsets, closure_index.indices
+    dirty = [False] * inst.nfiles
+    for fid in closure_index.topo_order.tolist():
+        dirty[fid] = inst.names[fid] in changed or \
+            any(dirty[indices[k]] for k in range(offsets[fid], offsets[fid + 1]))
+    return [target for target in inst.targets if target in changed_targets or dirty[inst.fileIds[target]]]
+
+
+def reused_schedule(new_instance, previous: Solution, keep: set) -> Solution:
+    """
+    Returns the steps of a previous schedule compiling the files in keep (kept in the same order on each
+    server), re-timed on the new instance. Since keep is closed under dependencies and only holds unchanged
+    files, the steps can only start earlier than before.
+    """
+    base = Solution(new_instance.nservers)
+    for s in range(new_instance.nservers):
+        base.compSteps[s] = [fname for fname in previous.compSteps[s] if fname in keep]
+    return DeltaEvaluator(new_instance, base).to_solution(Solution)
+
+
+def solve_sub_instances(sub_inst: "list[SubInstance]", lower_bounds: "list[int]", workers: int = 1, cache=None,
+                        budget: float = None) -> "list[Solution]":
+    """
+    Solves sub-instances as solve_instance does: within a time budget if given, by a pool of worker processes
+    if there are more than one, one after the other otherwise.
+    """
+    if budget is not None:
+        return solve_sub_instances_with_budget(sub_inst, TimeBudget(budget, workers), workers, cache, lower_bounds)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(solve_sub_instance, sub_inst, [cache] * len(sub_inst), lower_bounds))
+    return [solve_sub_instance(sub, cache, lower_bound) for sub, lower_bound in zip(sub_inst, lower_bounds)]
+
+
+def resolve_instance(old_instance, previous: Solution, new_instance, workers: int = 1, cache=None,
+                     budget: float = None, improve_seconds: float = None, improve_iterations: int = None,
+                     full_fallback: bool = False) -> Solution:
+    """
+    Solves a new version of an instance starting from the schedule of the previous one: only the targets
+    depending on a changed file (see instance_delta and affected_targets), and the new targets or those whose
+    deadline or points changed that the previous steps do not compile in time, are solved again. The steps the
+    other targets need are taken from the previous schedule (see reused_schedule), including the targets it
+    had dropped, and the new sub-instance schedules are merged into them by decreasing score. Files already
+    compiled by the reused steps are not compiled again.
+    If the number of servers changed, or the previous schedule does not fit the new instance, the instance
+    is solved from scratch with solve_instance.
+
+    Args:
+        old_instance (Instance): the previous version of the instance
+        previous (Solution): the schedule found for old_instance (e.g. read with loadSolution; only its
+            compSteps are used)
+        new_instance (Instance): the instance to solve
+        workers (int): number of worker processes solving the sub-instances (1 = no pool)
+        cache (SubInstanceCache): persistent cache of solved sub-instances, if any
+        budget (float): if given, the MIP runs are scheduled within about this many seconds
+        improve_seconds (float): if given, the result is improved by local search for this many seconds
+        improve_iterations (int): if given, the result is improved by local search for this many edits
+        full_fallback (bool): if set, the instance is also solved from scratch with solve_instance, and the
+            better of the two schedules is kept (the run then takes as long as a full one)
+    """
+    full_solve = lambda: solve_instance(new_instance, workers=workers, cache=cache, budget=budget,
+                                        improve_seconds=improve_seconds, improve_iterations=improve_iterations)
+    if old_instance.nservers != new_instance.nservers:
+        return full_solve()
+
+    with telemetry.span('incremental', instance=new_instance.name) as sp:
+        closure_index = ClosureIndex(new_instance)
+        bounds = CriticalPathBounds(closure_index)
+        inst = closure_index.instance
+        changed, changed_targets = instance_delta(old_instance, new_instance)
+        affected = set(affected_targets(closure_index, changed, set()))
+        closures = {}
+        for target in inst.targets:
+            if target not in affected:
+                closures[target] = set(inst.names[fid] for fid in closure_index.closure(inst.fileIds[target]))
+        try:
+            solution = reused_schedule(new_instance, previous, set().union(*closures.values()))
+        except ValueError:
+            sp.set(fallback=True)
+            return full_solve()
+        # a changed target keeps its steps if they still compile it in time
+        missed = set(target for target in changed_targets if target in closures and
+                     (target not in solution.fileRows or
+                      solution.earliestAvailTime(target) > inst.files[target].deadline))
+        if missed:
+            solution = reused_schedule(new_instance, previous,
+                                       set().union(*[closures[target] for target in closures if target not in missed]))
+
+        sub_inst, lower_bounds = [], []
+        for target in inst.targets:
+            fid = inst.fileIds[target]
+            if (target in affected or target in missed) and not bounds.hopeless(fid):
+                sub_inst.append(closure_index.sub_instance(target))
+                lower_bounds.append(bounds.finish_lower_bound(fid))
+        sp.set(changed_files=len(changed), changed_targets=len(changed_targets), affected=len(affected),
+               missed=len(missed), solved=len(sub_inst), reused_steps=len(solution.filesCompTimeList))
+        sub_sol = solve_sub_instances(sub_inst, lower_bounds, workers, cache, budget)
+
+        scores = [sub_instance_score(sub, sub_solution) for sub, sub_solution in zip(sub_inst, sub_sol)]
+        for i in sorted(range(len(sub_inst)), key=lambda i: -scores[i]):
+            if scores[i] > 0:   # skip subproblems we couldn't solve
+                solution = merge_sub_instances(sub_inst[i], solution, sub_inst[i], sub_sol[i])
+            else:
+                telemetry.count('merge.skipped')
+
+        if full_fallback:
+            full = solve_instance(new_instance, workers=workers, cache=cache, budget=budget)
+            score, full_score = solution.evalCheck(new_instance), full.evalCheck(new_instance)
+            sp.set(score=score, full_score=full_score)
+            if full_score > score:
+                solution = full
+
+    if improve_seconds is not None or improve_iterations is not None:
+        solution = improve_solution(new_instance, solution, improve_seconds, improve_iterations)
+    return solution
@@ -1,3 +1,9 @@
+from collections.abc import Mapping
+import numpy as np
+import hashlib
+import json
+import os
+
 class CompiledFile():
 	def __init__(self, name: str, ctime: int, rtime: int, dependencies: "list[str]"):
 		self.name = name
@@ -16,6 +22,10 @@ class Instance():
 		self.nservers = nservers
 		self.name = name
 
+	@property
+	def filesDict(self) -> dict:
+		return self.files
+
 	def log(self):
 		for f in self.files:
 			print(self.files[f])
@@ -50,12 +60,244 @@ def loadInstance(filename: str) -> Instance:
 			targets.append(name)
 		return Instance(files, targets, nservers, filename)
 
+class CompiledFilesView(Mapping):
+	"""
+	Read-only, name-keyed view over a CompactInstance. It behaves like the files dictionary
+	of an Instance, but CompiledFile objects are only built (and then cached) when accessed.
+	"""
+	def __init__(self, instance: "CompactInstance"):
+		self.instance = instance
+		self.cache = {}
+
+	def __getitem__(self, name: str) -> CompiledFile:
+		cf = self.cache.get(name)
+		if cf is None:
+			cf = self.instance.compiledFile(self.instance.fileIds[name])
+			self.cache[name] = cf
+		return cf
+
+	def __contains__(self, name) -> bool:
+		return name in self.instance.fileIds
+
+	def __iter__(self):
+		return iter(self.instance.names)
+
+	def __len__(self) -> int:
+		return len(self.instance.names)
+
+class CompactInstance():
+	"""
+	Array-backed version of an Instance. Files are identified by integer IDs (their position in the
+	input file), per-file data is kept in NumPy arrays and the dependencies are stored in CSR form:
+	the IDs of the dependencies of file i are depIndices[depOffsets[i]:depOffsets[i+1]].
+	The name-keyed API of Instance (files, targets, filesDict) is available as a thin view on top.
+	"""
+	def __init__(self, names: "list[str]", ctime, rtime, deadline, points, depOffsets, depIndices, targetIds, nservers: int, name: str):
+		self.names = names
+		self.fileIds = {fname: idx for idx, fname in enumerate(names)}
+		self.ctime = np.asarray(ctime, dtype=np.int64)
+		self.rtime = np.asarray(rtime, dtype=np.int64)
+		self.deadline = np.asarray(deadline, dtype=np.int64)
+		self.points = np.asarray(points, dtype=np.int64)
+		self.depOffsets = np.asarray(depOffsets, dtype=np.int64)
+		self.depIndices = np.asarray(depIndices, dtype=np.int64)
+		self.targetIds = np.asarray(targetIds, dtype=np.int64)
+		self.nservers = nservers
+		self.name = name
+		self.files = CompiledFilesView(self)
+		self.targets = [names[t] for t in self.targetIds]
+
+	@property
+	def filesDict(self) -> CompiledFilesView:
+		return self.files
+
+	@property
+	def nfiles(self) -> int:
+		return len(self.names)
+
+	def dependencyIds(self, fid: int) -> np.ndarray:
+		return self.depIndices[self.depOffsets[fid]:self.depOffsets[fid+1]]
+
+	def subInstance(self, targetId: int, fileIds, targetIds: "list[int]" = None) -> "SubInstance":
+		"""
+		Builds the SubInstance made of the files with the given IDs (kept in the given order) for target targetId,
+		or for all the targets in targetIds (targetId being the main one) if given.
+		"""
+		filesList = [self.files[self.names[fid]] for fid in fileIds]
+		filesDict = {cf.name: cf for cf in filesList}
+		targets = [self.names[tid] for tid in targetIds] if targetIds is not None else None
+		return SubInstance(filesList, filesDict, self.names[targetId], self.nservers, targets)
+
+	def compiledFile(self, fid: int) -> CompiledFile:
+		cf = CompiledFile(self.names[fid], int(self.ctime[fid]), int(self.rtime[fid]),
+				[self.names[d] for d in self.dependencyIds(fid)])
+		cf.deadline = int(self.deadline[fid])
+		cf.points = int(self.points[fid])
+		return cf
+
+	def log(self):
+		for fname in self.files:
+			print(self.files[fname])
+		print(self.targets)
+		print(self.nservers)
+
+def compactInstance(instance: Instance) -> CompactInstance:
+	if isinstance(instance, CompactInstance):
+		return instance
+	names = list(instance.files.keys())
+	fileIds = {fname: idx for idx, fname in enumerate(names)}
+	files = [instance.files[fname] for fname in names]
+	depOffsets = np.zeros(len(files) + 1, dtype=np.int64)
+	depOffsets[1:] = np.cumsum([len(cf.dependencies) for cf in files])
+	depIndices = [fileIds[dep] for cf in files for dep in cf.dependencies]
+	return CompactInstance(names,
+		[cf.ctime for cf in files], [cf.rtime for cf in files],
+		[cf.deadline for cf in files], [cf.points for cf in files],
+		depOffsets, depIndices, [fileIds[t] for t in instance.targets],
+		instance.nservers, instance.name)
+
+def tokenizeInstance(filename: str) -> "list[str]":
+	"""
+	Reads a whole input file at once and splits it into whitespace-separated tokens.
+	"""
+	with open(filename) as fp:
+		return fp.read().split()
+
+def loadCompactInstance(filename: str) -> CompactInstance:
+	tokens = tokenizeInstance(filename)
+	# read metadata
+	nfiles, ntargets, nservers = int(tokens[0]), int(tokens[1]), int(tokens[2])
+	assert(nfiles >= 1 and nfiles <= 100000)
+	assert(ntargets >= 1 and ntargets <= nfiles)
+	assert(nservers >= 1 and nservers <= 100)
+	# read compiled files, dependencies are resolved to IDs once all the names are known
+	names = []
+	ctime = np.zeros(nfiles, dtype=np.int64)
+	rtime = np.zeros(nfiles, dtype=np.int64)
+	depOffsets = np.zeros(nfiles + 1, dtype=np.int64)
+	depNames = []
+	pos = 3
+	for c in range(nfiles):
+		names.append(tokens[pos])
+		ctime[c] = int(tokens[pos+1])
+		rtime[c] = int(tokens[pos+2])
+		ndeps = int(tokens[pos+3])
+		depNames.extend(tokens[pos+4:pos+4+ndeps])
+		depOffsets[c+1] = depOffsets[c] + ndeps
+		pos += 4 + ndeps
+	assert(len(tokens) == pos + 3 * ntargets)
+	fileIds = {fname: idx for idx, fname in enumerate(names)}
+	assert(len(fileIds) == nfiles)
+	depIndices = np.fromiter((fileIds[dep] for dep in depNames), dtype=np.int64, count=len(depNames))
+	# read targets
+	deadline = np.full(nfiles, -1, dtype=np.int64)
+	points = np.zeros(nfiles, dtype=np.int64)
+	targetIds = []
+	for t in range(ntargets):
+		name, dl, pts = tokens[pos:pos+3]
+		pos += 3
+		assert(name in fileIds)
+		fid = fileIds[name]
+		deadline[fid] = int(dl)
+		points[fid] = int(pts)
+		targetIds.append(fid)
+	return CompactInstance(names, ctime, rtime, deadline, points, depOffsets, depIndices, targetIds, nservers, filename)
+
+CACHE_MAGIC = b'HC19CACHE1\n'
+CACHE_ARRAYS = ['ctime', 'rtime', 'deadline', 'points', 'depOffsets', 'depIndices', 'targetIds']
+
+def fileDigest(filename: str) -> str:
+	digest = hashlib.sha256()
+	with open(filename, 'rb') as fp:
+		for chunk in iter(lambda: fp.read(1 << 20), b''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+def saveInstanceCache(instance: CompactInstance, filename: str, cachePath: str, digest: str = None):
+	"""
+	Writes the pre-parsed form of the instance read from filename to cachePath: a header line
+	(the size, mtime and SHA-256 of the input, plus the layout of the arrays) followed by the raw
+	arrays and the names table, each aligned to 64 bytes so that they can be memory-mapped.
+	The SHA-256 is computed unless given as digest.
+	The file is written to a temporary path first and then atomically renamed.
+	"""
+	st = os.stat(filename)
+	blobs = [np.ascontiguousarray(getattr(instance, key), dtype=np.int64).tobytes() for key in CACHE_ARRAYS]
+	blobs.append('\n'.join(instance.names).encode())
+	layout = []
+	offset = 0
+	for blob in blobs:
+		layout.append([offset, len(blob)])
+		offset += (len(blob) + 63) // 64 * 64
+	if digest is None:
+		digest = fileDigest(filename)
+	header = json.dumps({'size': st.st_size, 'mtime': st.st_mtime_ns, 'sha256': digest,
+						'nservers': instance.nservers, 'layout': layout}).encode() + b'\n'
+	start = (len(CACHE_MAGIC) + len(header) + 63) // 64 * 64
+	tmpPath = f'{cachePath}.{os.getpid()}.tmp'
+	with open(tmpPath, 'wb') as fp:
+		fp.write(CACHE_MAGIC + header)
+		for (off, _), blob in zip(layout, blobs):
+			fp.seek(start + off)
+			fp.write(blob)
+	os.replace(tmpPath, cachePath)
+
+def loadInstanceCache(cachePath: str, filename: str) -> CompactInstance:
+	"""
+	Loads a cache written by saveInstanceCache, memory-mapping its arrays (no copy).
+	Returns None if the cache is missing, unreadable or stale: the input is considered unchanged if its
+	size and mtime match, or (e.g. after a touch) if its content still has the same SHA-256: in the latter
+	case the cache is written again with the new mtime, so that the next loads do not hash the input again.
+	"""
+	try:
+		with open(cachePath, 'rb') as fp:
+			if fp.readline() != CACHE_MAGIC:
+				return None
+			headerLine = fp.readline()
+			header = json.loads(headerLine)
+		st = os.stat(filename)
+	except (OSError, ValueError):
+		return None
+	if st.st_size != header['size']:
+		return None
+	touched = st.st_mtime_ns != header['mtime']
+	if touched and fileDigest(filename) != header['sha256']:
+		return None
+	start = (len(CACHE_MAGIC) + len(headerLine) + 63) // 64 * 64
+	data = np.memmap(cachePath, dtype=np.uint8, mode='r')
+	arrays = {}
+	for key, (off, length) in zip(CACHE_ARRAYS, header['layout']):
+		arrays[key] = data[start+off:start+off+length].view(np.int64)
+	off, length = header['layout'][-1]
+	names = data[start+off:start+off+length].tobytes().decode().split('\n')
+	instance = CompactInstance(names, arrays['ctime'], arrays['rtime'], arrays['deadline'], arrays['points'],
+		arrays['depOffsets'], arrays['depIndices'], arrays['targetIds'], header['nservers'], filename)
+	if touched:
+		# the arrays stay mapped from the replaced file
+		saveInstanceCache(instance, filename, cachePath, header['sha256'])
+	return instance
+
+def loadCachedInstance(filename: str, cachePath: str = None) -> CompactInstance:
+	"""
+	Loads an instance through its pre-parsed cache (by default next to the input, as <filename>.cache),
+	parsing the input and (re)writing the cache only if the cache is missing or stale.
+	"""
+	if cachePath is None:
+		cachePath = f'{filename}.cache'
+	instance = loadInstanceCache(cachePath, filename)
+	if instance is None:
+		instance = loadCompactInstance(filename)
+		saveInstanceCache(instance, filename, cachePath)
+	return instance
+
 class SubInstance ():
-	def __init__(self, filesList: "list[CompiledFile]", filesDict: dict, target: list, nservers):
+	def __init__(self, filesList: "list[CompiledFile]", filesDict: dict, target: list, nservers, targets: list = None):
 		self.filesList = filesList
 		self.filesDict = filesDict
 		self.target = target
+		self.targets = targets if targets is not None else [target]		# all the targets (clusters have several)
 		self.nservers = nservers
+		self.filesIdx = {cf.name: idx for idx, cf in enumerate(filesList)}	# name -> position in filesList
 
 	def log(self):
 		print('Files:')
@@ -67,9 +309,60 @@ class SubInstance ():
 		print(self.nservers)
 
 	def get_times_and_idx(self, fname: str):
-		for idx in range(len(self.filesList)):
-			if self.filesList[idx].name == fname:
-				return [self.filesList[idx].ctime, self.filesList[idx].rtime, idx]
+		idx = self.filesIdx[fname]
+		return [self.filesList[idx].ctime, self.filesList[idx].rtime, idx]
+
+	def get_time_windows(self):
+		"""
+		Returns, for each file of filesList, the earliest time it can start (longest chain of compilations
+		it depends on) and the latest time it can start for the target to start by its deadline
+		(deadline minus the longest chain of compilations from the file to the target).
+		Assumes filesList is topologically sorted, as built by the solver.
+		"""
+		n = len(self.filesList)
+		earliest = [0] * n
+		for idx, cf in enumerate(self.filesList):
+			for dep in cf.dependencies:
+				d = self.filesIdx[dep]
+				earliest[idx] = max(earliest[idx], earliest[d] + self.filesList[d].ctime)
+		tail = [None] * n
+		tail[self.filesIdx[self.target]] = 0
+		for idx in range(n - 1, -1, -1):
+			if tail[idx] is None:
+				continue
+			for dep in self.filesList[idx].dependencies:
+				d = self.filesIdx[dep]
+				chain = tail[idx] + self.filesList[d].ctime
+				if tail[d] is None or chain > tail[d]:
+					tail[d] = chain
+		deadline = self.get_deadline()
+		latest = [deadline - (tail[idx] if tail[idx] is not None else 0) for idx in range(n)]
+		return [earliest, latest]
+
+	def get_ancestors(self) -> "list[int]":
+		"""
+		Returns, for each file of filesList, the bitset (as an int, bit i = position i in filesList) of the
+		files it (transitively) depends on. Assumes filesList is topologically sorted.
+		"""
+		anc = [0] * len(self.filesList)
+		for idx, cf in enumerate(self.filesList):
+			for dep in cf.dependencies:
+				d = self.filesIdx[dep]
+				anc[idx] |= anc[d] | (1 << d)
+		return anc
+
+	def get_closure(self, target: str) -> set:
+		"""
+		Returns the names of target and of all the files of the sub-instance it (transitively) depends on.
+		"""
+		closure = {target}
+		stack = [target]
+		while stack:
+			for dep in self.filesDict[stack.pop()].dependencies:
+				if dep not in closure:
+					closure.add(dep)
+					stack.append(dep)
+		return closure
 
 	def get_deadline(self) -> int:
 		assert(self.target in self.filesDict.keys())
@@ -78,3 +371,15 @@ class SubInstance ():
 	def get_compil_points(self) -> int:
 		assert(self.target in self.filesDict.keys())
 		return self.filesDict[self.target].points
+
+	def get_score(self, finish_times: "list[int]") -> int:
+		"""
+		Returns the points the targets are worth if ready at the given times (in the order of targets):
+		for each target in time, the points it is worth plus one per second before its deadline.
+		"""
+		score = 0
+		for target, finish in zip(self.targets, finish_times):
+			deadline = self.filesDict[target].deadline
+			if finish <= deadline:
+				score += deadline - finish + self.filesDict[target].points
+		return score
@@ -0,0 +1,134 @@
+from bisect import bisect_left, bisect_right
+
+
+class FreeIntervals():
+    """
+    Idle intervals of a single server, i.e. the gaps between its compilation steps, kept sorted by start time.
+    A max-segment tree over the gap lengths answers "earliest gap starting at or after t which is longer
+    than c" in logarithmic time. Gaps are only ever shrunk in place or appended at the end, except when
+    a compilation is recorded in the middle of a gap (e.g. from a MIP solution), which splits it.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.tail = 0           # end of the last compilation step of the server
+        self.size = 1
+        self.tree = [0, 0]      # tree[1] is the root, leaves start at tree[size]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def _rebuild(self):
+        size = 1
+        while size < len(self.starts):
+            size *= 2
+        self.size = size
+        self.tree = [0] * (2 * size)
+        for i in range(len(self.starts)):
+            self.tree[size + i] = self.ends[i] - self.starts[i]
+        for node in range(size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def _update_path(self, node: int):
+        node //= 2
+        while node:
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+            node //= 2
+
+    def _update(self, i: int):
+        self.tree[self.size + i] = self.ends[i] - self.starts[i]
+        self._update_path(self.size + i)
+
+    def _append(self, start: int, end: int):
+        self.starts.append(start)
+        self.ends.append(end)
+        if len(self.starts) > self.size:
+            self._rebuild()
+        else:
+            self._update(len(self.starts) - 1)
+
+    def _first_longer(self, node: int, lo: int, hi: int, i0: int, length: int) -> int:
+        if hi <= i0 or self.tree[node] <= length:
+            return -1
+        if hi - lo == 1:
+            return lo
+        mid = (lo + hi) // 2
+        found = self._first_longer(2 * node, lo, mid, i0, length)
+        if found < 0:
+            found = self._first_longer(2 * node + 1, mid, hi, i0, length)
+        return found
+
+    def longest_gap(self) -> int:
+        """
+        Returns the length of the longest gap (0 if there is none).
+        """
+        return self.tree[1]
+
+    def earliest_start(self, t: int, length: int) -> int:
+        """
+        Returns the earliest time a compilation of the given length can start on the server, provided that
+        it can not start before t: the start of the first gap beginning at or after t which is strictly
+        longer than length, otherwise the first instant after the last compilation (and not before t).
+        """
+        i0 = bisect_left(self.starts, t)
+        if i0 < len(self.starts):
+            idx = self._first_longer(1, 0, self.size, i0, length)
+            if idx >= 0:
+                return self.starts[idx]
+        return max(self.tail, t)
+
+    def reserve(self, start: int, length: int):
+        """
+        Marks [start, start + length) as busy.
+        Returns a record of the change, which undo() can revert.
+        """
+        end = start + length
+        if start >= self.tail:
+            change = ('tail', self.tail, start > self.tail)
+            if start > self.tail:
+                self._append(self.tail, start)
+            self.tail = end
+            return change
+        idx = bisect_right(self.starts, start) - 1
+        assert(idx >= 0 and self.starts[idx] <= start and end <= self.ends[idx])   # no overlapping compilations
+        if start == self.starts[idx]:
+            # the common case: the gap is filled from its beginning (empty gaps are kept, with length 0)
+            change = ('start', idx, self.starts[idx])
+            self.starts[idx] = end
+            self._update(idx)
+        elif end == self.ends[idx]:
+            change = ('end', idx, self.ends[idx])
+            self.ends[idx] = start
+            self._update(idx)
+        else:
+            change = ('split', idx, self.ends[idx])
+            self.starts.insert(idx + 1, end)
+            self.ends.insert(idx + 1, self.ends[idx])
+            self.ends[idx] = start
+            self._rebuild()
+        return change
+
+    def undo(self, change):
+        """
+        Reverts a change returned by reserve(); changes must be undone in reverse order.
+        """
+        kind, a, b = change
+        if kind == 'tail':
+            self.tail = a
+            if b:
+                self.starts.pop()
+                self.ends.pop()
+                self.tree[self.size + len(self.starts)] = 0
+                self._update_path(self.size + len(self.starts))
+        elif kind == 'start':
+            self.starts[a] = b
+            self._update(a)
+        elif kind == 'end':
+            self.ends[a] = b
+            self._update(a)
+        else:
+            del self.starts[a + 1]
+            del self.ends[a + 1]
+            self.ends[a] = b
+            self._rebuild()
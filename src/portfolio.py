@@ -0,0 +1,203 @@
+import time
+import heapq
+import random
+import numpy as np
+from instance import *
+from solution import *
+from closure import ClosureIndex
+from bounds import CriticalPathBounds
+from concurrent.futures import ProcessPoolExecutor
+from solver import solve_instance, heuristically_solve_sub_instance, merge_sub_instances, sub_instance_score, \
+    build_sub_instance
+from checkpoint import schedule_steps, schedule_from_steps
+from improve import improve_solution
+import telemetry
+
+ORDERINGS = ['dfs', 'critical_path', 'rtime', 'slack']
+MERGE_ORDERS = ['rank', 'score', 'deadline', 'random']
+
+
+def portfolio_variant(seed: int, index: int) -> dict:
+    """
+    Returns the index-th variant of a portfolio: the pairs (ordering, merge order) are taken in turn, the
+    ordering changing first. In the first round of pairs, ties between files are broken by their DFS
+    position, so that variant 0 is the plain heuristic of solve_instance (without the MIP); in the next rounds
+    they are broken by a random key. The random choices of a variant only depend on seed and index.
+    """
+    rounds, pair = divmod(index, len(ORDERINGS) * len(MERGE_ORDERS))
+    return {'index': index,
+            'ordering': ORDERINGS[pair % len(ORDERINGS)],
+            'merge_order': MERGE_ORDERS[pair // len(ORDERINGS)],
+            'random_ties': rounds > 0,
+            'seed': seed * 1000003 + index}
+
+
+def priority_order(sub_instance: SubInstance, ordering: str, rng: random.Random = None) -> SubInstance:
+    """
+    Returns a copy of a sub-instance whose filesList is another topological order, for the list scheduling
+    heuristic: each next file is the one of highest priority among those whose dependencies come before.
+    The priority rules are:
+        - dfs: the DFS order of the closure, unchanged (unless ties are random)
+        - critical_path: longest chain of compilations from the file to a target first
+        - rtime: largest replication time first
+        - slack: smallest time window (latest minus earliest start, see get_time_windows) first
+    Ties are broken by DFS position, or by a random key drawn from rng if given.
+    """
+    files = sub_instance.filesList
+    filesIdx = sub_instance.filesIdx
+    n = len(files)
+    if ordering == 'critical_path':
+        chain = [cf.ctime for cf in files]
+        for idx in range(n - 1, -1, -1):
+            for dep in files[idx].dependencies:
+                d = filesIdx[dep]
+                chain[d] = max(chain[d], files[d].ctime + chain[idx])
+        key = [-c for c in chain]
+    elif ordering == 'rtime':
+        key = [-cf.rtime for cf in files]
+    elif ordering == 'slack':
+        earliest, latest = sub_instance.get_time_windows()
+        key = [l - e for e, l in zip(earliest, latest)]
+    else:
+        assert(ordering == 'dfs')
+        key = [0] * n
+    tie = list(range(n)) if rng is None else [rng.random() for _ in range(n)]
+
+    missing = [len(cf.dependencies) for cf in files]
+    dependents = [[] for _ in range(n)]
+    for idx, cf in enumerate(files):
+        for dep in cf.dependencies:
+            dependents[filesIdx[dep]].append(idx)
+    ready = [(key[idx], tie[idx], idx) for idx in range(n) if missing[idx] == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        _, _, idx = heapq.heappop(ready)
+        order.append(files[idx])
+        for d in dependents[idx]:
+            missing[d] -= 1
+            if missing[d] == 0:
+                heapq.heappush(ready, (key[d], tie[d], d))
+    assert(len(order) == n)
+    return SubInstance(order, sub_instance.filesDict, sub_instance.target, sub_instance.nservers,
+                       sub_instance.targets)
+
+
+def merge_order(sub_inst: "list[SubInstance]", scores: "list[int]", rule: str, rng: random.Random) -> "list[int]":
+    """
+    Returns the order the sub-instance schedules are merged in:
+        - rank: the order of solve_instance
+        - score: most points first
+        - deadline: earliest deadline first (most points first among equal deadlines)
+        - random: shuffled by rng
+    """
+    n = len(sub_inst)
+    if rule == 'rank':
+        return np.argsort(np.argsort(scores)).tolist()
+    if rule == 'score':
+        return sorted(range(n), key=lambda i: -scores[i])
+    if rule == 'deadline':
+        return sorted(range(n), key=lambda i: (sub_inst[i].get_deadline(), -scores[i]))
+    assert(rule == 'random')
+    order = list(range(n))
+    rng.shuffle(order)
+    return order
+
+
+_portfolio = None   # [instance, sub-instances] of the portfolio run by this process (see init_portfolio)
+
+
+def init_portfolio(instance: Instance):
+    """
+    Builds, once per process, the sub-instances of the targets which can still meet their deadline.
+    """
+    global _portfolio
+    closure_index = ClosureIndex(instance)
+    bounds = CriticalPathBounds(closure_index)
+    sub_inst = [build_sub_instance(closure_index, bounds, [target])[0] for target in instance.targets
+                if not bounds.hopeless(closure_index.instance.fileIds[target])]
+    _portfolio = [instance, sub_inst]
+
+
+def run_variant(seed: int, index: int, deadline: float = None):
+    """
+    Solves the instance given to init_portfolio with a variant of the heuristic (see portfolio_variant): each
+    sub-instance is scheduled by list scheduling in the order of its priority rule, and the schedules are merged
+    in its merge order. Returns [index, score (by evalCheck), schedule steps], or [index, None, None] if the
+    deadline (a time.time() value) passed first.
+    """
+    instance, sub_inst = _portfolio
+    variant = portfolio_variant(seed, index)
+    rng = random.Random(variant['seed'])
+    ties = rng if variant['random_ties'] else None
+    with telemetry.span('variant', instance=instance.name, **variant) as sp:
+        sub_sol = []
+        for sub_problem in sub_inst:
+            if deadline is not None and time.time() > deadline:
+                sp.set(expired=True)
+                return [index, None, None]
+            sub_sol.append(heuristically_solve_sub_instance(priority_order(sub_problem, variant['ordering'], ties)))
+        if not sub_inst:
+            return [index, 0, []]
+        scores = [sub_instance_score(sub, sub_solution) for sub, sub_solution in zip(sub_inst, sub_sol)]
+        order = merge_order(sub_inst, scores, variant['merge_order'], rng)
+        solution = sub_sol[order[0]]
+        prev_inst = sub_inst[order[0]]
+        for i in order[1:]:
+            if deadline is not None and time.time() > deadline:
+                sp.set(expired=True)
+                return [index, None, None]
+            if scores[i] > 0:   # skip subproblems we couldn't solve
+                solution = merge_sub_instances(prev_inst, solution, sub_inst[i], sub_sol[i])
+                prev_inst = sub_inst[i]
+        score = solution.evalCheck(instance)
+        sp.set(score=score)
+    return [index, score, schedule_steps(solution)]
+
+
+def solve_portfolio(instance: Instance, variants: int, workers: int = 1, seconds: float = None, seed: int = 0,
+                    cache=None, budget: float = None, improve_seconds: float = None,
+                    improve_iterations: int = None) -> Solution:
+    """
+    Runs a portfolio of variants of the list scheduling heuristic (see portfolio_variant and run_variant) next
+    to the usual solve_instance (MIP included), and returns the best schedule by evalCheck score. The variants
+    are run by a pool of worker processes while solve_instance runs in this one; on equal scores, the
+    schedule of solve_instance wins, then the variant of lowest index, so that the result does not depend
+    on the number of workers nor on the order the variants finish in.
+
+    Args:
+        instance (Instance): the instance to solve
+        variants (int): number of variants of the heuristic to run
+        workers (int): number of worker processes running the variants (1 = no pool, after solve_instance)
+        seconds (float): if given, the variants not done within this many seconds are dropped (then the result
+            depends on how far they got); solve_instance is not affected
+        seed (int): seed of the random choices of the variants
+        cache (SubInstanceCache): persistent cache of solved sub-instances, if any (solve_instance only)
+        budget (float): if given, the MIP runs of solve_instance are scheduled within about this many seconds
+        improve_seconds (float): if given, the best schedule is improved by local search for this many seconds
+        improve_iterations (int): if given, the best schedule is improved by local search for this many edits
+    """
+    deadline = time.time() + seconds if seconds is not None else None
+    with telemetry.span('portfolio', instance=instance.name, variants=variants, workers=workers) as sp:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_portfolio,
+                                     initargs=(instance,)) as executor:
+                futures = [executor.submit(run_variant, seed, index, deadline) for index in range(variants)]
+                solution = solve_instance(instance, cache=cache, budget=budget)
+                results = [future.result() for future in futures]
+        else:
+            solution = solve_instance(instance, cache=cache, budget=budget)
+            init_portfolio(instance)
+            results = [run_variant(seed, index, deadline) for index in range(variants)]
+
+        best_score, best_index = solution.evalCheck(instance), None
+        for index, score, steps in results:
+            if score is not None and score > best_score:
+                best_score, best_index, best_steps = score, index, steps
+        if best_index is not None:
+            solution = schedule_from_steps(best_steps, instance, instance.nservers)
+        sp.set(score=best_score, best=best_index, done=sum(score is not None for _, score, _ in results))
+
+    if improve_seconds is not None or improve_iterations is not None:
+        solution = improve_solution(instance, solution, improve_seconds, improve_iterations)
+    return solution
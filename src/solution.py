@@ -1,116 +1,251 @@
-from collections import deque
+from heapq import heappush, heappop
 from instance import *
+from intervals import FreeIntervals
+from sortedlist import SortedKeyList
+from bisect import bisect_left
+from collections.abc import Mapping
+import numpy as np
 import sys
+import telemetry
 
 class SchedFile():
 	def __init__(self, fname: str, sched_time: int, server: int):
 		self.fname = fname
 		self.sched_time = sched_time
 		self.server = server
+
+class ServerAvailTime(Mapping):
+	"""
+	Read-only view of the times files are available at a given server, computed on demand from the
+	compilation records of the solution (see Solution.availTime). Only the compiled files are keys.
+	"""
+	def __init__(self, solution: "Solution", server: int):
+		self.solution = solution
+		self.server = server
+
+	def __getitem__(self, fname: str) -> int:
+		if fname not in self.solution.fileRows:
+			raise KeyError(fname)
+		return self.solution.availTime(fname, self.server)
+
+	def __contains__(self, fname) -> bool:
+		return fname in self.solution.fileRows
+
+	def __iter__(self):
+		return iter(self.solution.fileRows)
+
+	def __len__(self) -> int:
+		return len(self.solution.fileRows)
+
 class Solution():
 	def __init__(self, nservers):
 		self.nservers = nservers	
 		self.compSteps = [[] for s in range(self.nservers)]			# compilation steps performed at each server. Kept in chronological order
-		self.filesAvailTime = [{} for s in range(self.nservers)]	# times when files are ready at each server 
-		self.filesCompTimeList = []
+		self.filesAvailTime = [ServerAvailTime(self, s) for s in range(self.nservers)]	# times when files are ready at each server (views)
+		self.fileRows = {}											# compiled file -> its row in bestFinish and rtimes
+		self.bestFinish = np.zeros(16, dtype=np.int64)				# earliest finish of each compiled file, on any server
+		self.rtimes = np.zeros(16, dtype=np.int64)					# replication time of each compiled file
+		self.compRecords = {}										# compiled file -> [server, finish] of each of its compilations
+		self.filesCompTimeList = SortedKeyList()						# all the compilation steps, kept sorted w.r.t. compilation time
+		self.stepTimes = [[] for s in range(self.nservers)]			# compilation times of compSteps, to find where to insert new steps
+		self.stepSets = [set() for s in range(self.nservers)]		# files compiled at each server, to quickly check membership
 		self.filesCompTimeDict = {}									# faster to search compared to the corresponding list, but not sorted time wise
 		self.currTime = [0 for s in range(self.nservers)]			# current time at each server ~ last instant during which a file is compiled
 		self.gaps = [False for s in range(self.nservers)]			# are there gaps between compilation in a given server ?
+		self.freeIntervals = [FreeIntervals() for s in range(self.nservers)]	# idle intervals of each server, to fill gaps quickly
+		self.scheduled = set()										# files compiled at any server
+		self.journal = None											# undo records of the changes made since checkpoint(), if any
 
 	def log(self):
 		for s in range(self.nservers):
 			print(self.compSteps[s])
 
 	def evalCheck(self, instance) -> int:
-		# queue of compilation steps for each server
-		queues = [deque(self.compSteps[s]) for s in range(instance.nservers)]
-		# current time at each server
-		time = [0 for s in range(instance.nservers)]
-		# files ready at each server (with corresponding time)
-		files = [{} for s in range(instance.nservers)]
-		# simulate compilation
-		while(True):
-			nDone = 0
-			for s in range(instance.nservers):
-				if not queues[s]:
-					continue
-				f = queues[s][0]
-				# check if all dependencies are satisfied
-				cf = instance.files[f]
-				depOk = True
-				startTime = time[s]
-				for dep in cf.dependencies:
-					if dep not in files[s]:
-						depOk = False
-						break
-					else:
-						startTime = max(startTime, files[s][dep])
-				if depOk:
-					#print(f'Execute {cf.name} on server {s} at time {startTime}-{startTime+cf.ctime}')
-					# remove it from queue
-					queues[s].popleft()
-					# we can execute f on s
-					nDone += 1
-					# mark f available (either by compilation or replication)
-					# NOTE: the same file might be compiled multiple times, either on the same server or on multiple servers.
-					#       Thus, we must be careful of not overwriting the time a file is available with a higher value.
-					for otherS in range(instance.nservers):
-						afterCompilation = startTime + cf.ctime
-						afterReplication = afterCompilation + cf.rtime
-						afterTime = afterReplication if otherS != s else afterCompilation
-						if cf.name in files[otherS]:
-							files[otherS][cf.name] = min(files[otherS][cf.name], afterTime)
-						else:
-							files[otherS][cf.name] = afterTime
-					time[s] = startTime + cf.ctime
-			if not nDone:
-				break
+		"""
+		Simulates the compilation steps and returns the score of the solution.
+		Each step is handled exactly once, in the order the checker's round-robin sweep reaches it: in each round,
+		every server in turn performs its next step if every dependency has been compiled somewhere by then. The
+		order of the rounds is worked out from the dependencies (see stepRound), without sweeping the queues: a
+		step is started as soon as the server is free and all dependencies are available on it, counting only the
+		compilations handled before it (this matters for files compiled more than once). Raises a ValueError naming
+		the stuck steps if the schedule deadlocks.
+
+		Args:
+			instance (Instance): the instance the solution refers to
+		"""
+		nservers = instance.nservers
+		files = instance.files
+		queues = self.compSteps
+		nextStep = [0] * nservers		# index of the next step to perform at each server
+		time = [0] * nservers			# current time at each server
+		lastRound = [-1] * nservers		# round of the sweep the last step of each server was performed in
+		best = {}						# earliest compilation of each file, as [finish time, server]
+		first = {}						# round and server of the first compilation of each file
+		dups = {}						# earliest finish at each server, only for files compiled more than once
+		missing = [0] * nservers		# dependencies of the next step of each server not compiled anywhere yet
+		waiting = {}					# servers whose next step waits for a given file
+		ready = []						# heap of (round, server) for the servers whose next step is ready
+
+		def availTime(fname, server):
+			finish, compServer = best[fname]
+			if compServer != server:
+				finish += files[fname].rtime
+			if fname in dups:
+				finish = min(finish, dups[fname].get(server, finish))
+			return finish
+
+		def stepRound(server):
+			# the round after the previous step of the server, and after the first compilation of each dependency
+			# (the same round if it was compiled by a server swept before this one)
+			rnd = lastRound[server] + 1
+			for dep in files[queues[server][nextStep[server]]].dependencies:
+				depRound, depServer = first[dep]
+				rnd = max(rnd, depRound + (depServer > server))
+			return rnd
+
+		def enqueue(server):
+			if nextStep[server] >= len(queues[server]):
+				return
+			count = 0
+			for dep in files[queues[server][nextStep[server]]].dependencies:
+				if dep not in best:
+					count += 1
+					waiting.setdefault(dep, []).append(server)
+			missing[server] = count
+			if count == 0:
+				heappush(ready, (stepRound(server), server))
+
+		for s in range(nservers):
+			enqueue(s)
+		while ready:
+			# steps are handled in increasing (round, server), the steps made ready by this one coming after it
+			rnd, s = heappop(ready)
+			cf = files[queues[s][nextStep[s]]]
+			start = time[s]
+			for dep in cf.dependencies:
+				start = max(start, availTime(dep, s))
+			finish = start + cf.ctime
+			time[s] = finish
+			lastRound[s] = rnd
+			nextStep[s] += 1
+			if cf.name not in best:
+				best[cf.name] = [finish, s]
+				first[cf.name] = (rnd, s)
+				for other in waiting.pop(cf.name, []):
+					missing[other] -= 1
+					if missing[other] == 0:
+						heappush(ready, (stepRound(other), other))
+			else:
+				# NOTE: the same file might be compiled multiple times, either on the same server or on multiple servers.
+				#       Only the earliest availability at each server matters.
+				if cf.name not in dups:
+					dups[cf.name] = {best[cf.name][1]: best[cf.name][0]}
+				dups[cf.name][s] = min(dups[cf.name].get(s, finish), finish)
+				if finish < best[cf.name][0]:
+					best[cf.name] = [finish, s]
+			enqueue(s)
+
 		# if queues are not empty, then we have messed up with dependencies
-		for s in range(instance.nservers):
-			assert(not queues[s])
-		# merge files from all servers
-		targets = {}
-		for s in range(instance.nservers):
-			for f in files[s]:
-				if f in targets:
-					targets[f] = min(targets[f], files[s][f])
-				else:
-					targets[f] = files[s][f]
+		stuck = [s for s in range(nservers) if nextStep[s] < len(queues[s])]
+		if stuck:
+			details = []
+			for s in stuck:
+				fname = queues[s][nextStep[s]]
+				deps = [dep for dep in files[fname].dependencies if dep not in best]
+				details.append(f'step {nextStep[s]} of server {s} ({fname}) waits for {deps}')
+			raise ValueError('Deadlock in the solution: ' + '; '.join(details))
+
 		# evaluate targets
 		score = 0
-		for t in targets:
-			cf = instance.files[t]
-			if (cf.points > 0) and (targets[t] <= cf.deadline):
-				score += (cf.deadline - targets[t]) + cf.points
+		for fname, (finish, _) in best.items():
+			cf = files[fname]
+			if (cf.points > 0) and (finish <= cf.deadline):
+				score += (cf.deadline - finish) + cf.points
 		return score
-	
+
+	def deltaEvaluator(self, instance):
+		"""
+		Returns a DeltaEvaluator on this solution, to score local edits (moves, swaps, insertions, removals)
+		incrementally. Use its to_solution(Solution) to get back a Solution once the edits are committed.
+
+		Args:
+			instance (Instance): the instance the solution refers to
+		"""
+		from evaluator import DeltaEvaluator
+		return DeltaEvaluator(instance, self)
+
+	def availTime(self, fname: str, server: int) -> int:
+		"""
+		Returns the time compiled file fname is available at server: the earliest of its compilations on
+		that server, or of its compilations anywhere plus the replication time.
+		"""
+		row = self.fileRows[fname]
+		avail = int(self.bestFinish[row] + self.rtimes[row])
+		for compServer, finish in self.compRecords[fname]:
+			if compServer == server and finish < avail:
+				avail = finish
+		return avail
+
+	def availTimes(self, fname: str) -> np.ndarray:
+		"""
+		Returns the times compiled file fname is available at each server.
+		"""
+		row = self.fileRows[fname]
+		avail = np.full(self.nservers, self.bestFinish[row] + self.rtimes[row], dtype=np.int64)
+		for compServer, finish in self.compRecords[fname]:
+			avail[compServer] = min(avail[compServer], finish)
+		return avail
+
+	def earliestAvailTime(self, fname: str) -> int:
+		"""
+		Returns the earliest time compiled file fname is available at any server (i.e. its earliest finish).
+		"""
+		return int(self.bestFinish[self.fileRows[fname]])
+
+	def depsAvailTime(self, deps: "list[str]"):
+		"""
+		Returns [default, special]: the time all the (compiled) files in deps are available at each server, as
+		the time for the servers which compiled none of them and a dict server -> time for the others.
+		This takes O(len(deps) + compilations of deps) operations instead of O(len(deps) * nservers).
+		"""
+		bases = []
+		own = {}	# server -> {dep: finish at the server}
+		for dep in deps:
+			row = self.fileRows[dep]
+			bases.append((int(self.bestFinish[row] + self.rtimes[row]), dep))
+			for compServer, finish in self.compRecords[dep]:
+				ownDeps = own.setdefault(compServer, {})
+				ownDeps[dep] = min(finish, ownDeps.get(dep, finish))
+		bases.sort(reverse=True)
+		default = bases[0][0] if bases else 0
+		special = {}
+		for server, ownDeps in own.items():
+			avail = 0
+			for base, dep in bases:
+				if dep in ownDeps:
+					avail = max(avail, min(base, ownDeps[dep]))
+				else:
+					avail = max(avail, base)	# the latest of the replicated dependencies
+					break
+			special[server] = avail
+		return [default, special]
+
 	def add_step(self, fname: str, server: int, instance: SubInstance):
 		assert(fname in instance.filesDict.keys())
-		all_dep_avail_time, sched_time = 0, 0		
+		all_dep_avail_time = 0
 		for dep in instance.filesDict[fname].dependencies:			# make sure the dependencies are available
-			assert(dep in self.filesAvailTime[server])
-			all_dep_avail_time = max(all_dep_avail_time, self.filesAvailTime[server][dep])
+			assert(dep in self.fileRows)
+			all_dep_avail_time = max(all_dep_avail_time, self.availTime(dep, server))
 
 		# if there are gaps in the current schedule, try to fit the compilation there
-		if self.gaps[server]:
-			for step in self.compSteps[server]:
-				if self.getSchedTime(step, server) > sched_time + instance.filesDict[fname].ctime and \
-					sched_time >= all_dep_avail_time:
-					# can schedule here
-					break;
-				else:
-					sched_time = self.filesAvailTime[server][step]
-		else:
-			sched_time = self.currTime[server]
-		
-		# make sure we do not schedule before all the dependencies are available
-		sched_time = max(sched_time, all_dep_avail_time)
-
-		#TODO: schedule dependencies twice (on a different server) if it makes sense to do so
-		# while(avail_time > min(self.currTime)):
-		
+		# (otherwise, schedule after the last compilation, but not before all the dependencies are available)
+		sched_time = self.freeIntervals[server].earliest_start(all_dep_avail_time, instance.filesDict[fname].ctime)
+
+		# NOTE: dependencies are compiled twice (on a different server) only by the duplicate move of the
+		# local search (see LocalSearch in improve.py), not here
+
 		# make sure we do not schedule twice a file on the same server
-		if(fname not in self.compSteps[server]):	
+		if(fname not in self.stepSets[server]):	
 			self.recordNewCompilation(instance, sched_time, server, fname)
 	
 	def get_earliest_server_for_file(self, fname: str, instance: SubInstance) -> int:
@@ -126,22 +261,14 @@ class Solution():
 
 		earliest_server = -1
 		earliest_time = sys.maxsize
+		ctime = instance.filesDict[fname].ctime
+		deps = instance.filesDict[fname].dependencies
+		assert(all(dep in self.fileRows for dep in deps))
+		default_avail_time, special_avail_time = self.depsAvailTime(deps)
 		for s in range(self.nservers):
-			s_time, avail_time = 0, 0
+			avail_time = special_avail_time.get(s, default_avail_time)
 
-			for dep in instance.filesDict[fname].dependencies:
-				assert(dep in self.filesAvailTime[s])
-				avail_time = max(avail_time, self.filesAvailTime[s][dep])
-
-			for step in self.compSteps[s]:
-				if self.getSchedTime(step, s) > s_time + instance.filesDict[fname].ctime and \
-					s_time >= avail_time:
-					# can sched here
-					break;
-				else:
-					s_time = self.filesAvailTime[s][step]
-
-			s_time = max(s_time, avail_time)
+			s_time = self.freeIntervals[s].earliest_start(avail_time, ctime)
 				
 			if (s_time < earliest_time):
 				earliest_time = s_time
@@ -162,41 +289,94 @@ class Solution():
 				print(f'{sched_file.fname} {sched_file.server}', file=f)
 			f.close()
 	
+	def checkpoint(self):
+		"""
+		Starts recording the changes made to the solution, so that they can be undone with rollback()
+		(or kept with commit()). Only the changes themselves are recorded, not the whole solution.
+		"""
+		self.journal = []
+
+	def commit(self):
+		"""
+		Keeps the changes made since checkpoint() and stops recording.
+		"""
+		telemetry.count('solution.steps_committed', len(self.journal))
+		self.journal = None
+
+	def rollback(self):
+		"""
+		Undoes the changes made since checkpoint() and stops recording.
+		"""
+		telemetry.count('solution.steps_rolled_back', len(self.journal))
+		for (fname, server, sched_time, sched_file, comp_steps_idx, old_avail, old_curr_time, old_gap,
+				interval_change, was_in_server, was_scheduled) in reversed(self.journal):
+			self.compRecords[fname].pop()
+			if old_avail is None:
+				del self.fileRows[fname]
+				del self.compRecords[fname]
+			else:
+				self.bestFinish[self.fileRows[fname]] = old_avail
+			self.freeIntervals[server].undo(interval_change)
+			self.currTime[server] = old_curr_time
+			self.gaps[server] = old_gap
+			del self.filesCompTimeDict[(fname, server)]
+			self.filesCompTimeList.remove(sched_time, sched_file)
+			del self.stepTimes[server][comp_steps_idx]
+			del self.compSteps[server][comp_steps_idx]
+			if not was_in_server:
+				self.stepSets[server].discard(fname)
+			if not was_scheduled:
+				self.scheduled.discard(fname)
+		self.journal = None
+
 	def recordNewCompilation(self, instance: SubInstance, sched_time: int, server: int, fname: str):
 
+		if self.journal is not None:
+			# NOTE: the same file is never recorded twice on the same server, so there is no previous time to restore
+			assert((fname, server) not in self.filesCompTimeDict)
+			old_avail = int(self.bestFinish[self.fileRows[fname]]) if fname in self.fileRows else None
+			old_curr_time, old_gap = self.currTime[server], self.gaps[server]
+			was_in_server, was_scheduled = fname in self.stepSets[server], fname in self.scheduled
+
 		# if we creating a gap, record it
 		if sched_time > self.currTime[server]:
 			self.gaps[server] = True
 
-		# update availability time
-		for otherS in range(instance.nservers):
-			if otherS != server:
-				self.filesAvailTime[otherS][fname] = sched_time + instance.filesDict[fname].ctime + \
-												instance.filesDict[fname].rtime
-			else:
-				self.filesAvailTime[otherS][fname] = sched_time + instance.filesDict[fname].ctime	
+		# update availability time: one record per compilation, plus the earliest finish of the file
+		finish = sched_time + instance.filesDict[fname].ctime
+		row = self.fileRows.get(fname)
+		if row is None:
+			row = len(self.fileRows)
+			if row == len(self.bestFinish):
+				self.bestFinish = np.concatenate([self.bestFinish, np.zeros(row, dtype=np.int64)])
+				self.rtimes = np.concatenate([self.rtimes, np.zeros(row, dtype=np.int64)])
+			self.fileRows[fname] = row
+			self.bestFinish[row] = finish
+			self.rtimes[row] = instance.filesDict[fname].rtime
+			self.compRecords[fname] = [(server, finish)]
+		else:
+			self.bestFinish[row] = min(self.bestFinish[row], finish)
+			self.compRecords[fname].append((server, finish))
 
 		# update time counter	
+		interval_change = self.freeIntervals[server].reserve(sched_time, instance.filesDict[fname].ctime)
 		self.currTime[server] = max(sched_time + instance.filesDict[fname].ctime, self.currTime[server])
 		# update dict (does not need to be sorted)
 		self.filesCompTimeDict[(fname, server)] = sched_time
 
-		# use insertion sort to update data structures which are kept orderd w.r.t. compilation time
-		idx = 0
-		file_before = None
-		while(idx < len(self.filesCompTimeList)):
-			if self.filesCompTimeList[idx].sched_time < sched_time:
-				if self.filesCompTimeList[idx].server == server:
-					file_before = self.filesCompTimeList[idx].fname
-				idx = idx + 1
-			else:
-				break
-		self.filesCompTimeList.insert(idx, SchedFile(fname, sched_time, server))
-
-		comp_steps_idx = 0
-		if file_before is not None:
-			comp_steps_idx = self.compSteps[server].index(file_before) + 1	# schedule just after
+		# update data structures which are kept orderd w.r.t. compilation time (new steps go before steps
+		# starting at the same time, and on the server just after the last step starting earlier)
+		sched_file = SchedFile(fname, sched_time, server)
+		self.filesCompTimeList.insert(sched_time, sched_file)
+		comp_steps_idx = bisect_left(self.stepTimes[server], sched_time)
+		self.stepTimes[server].insert(comp_steps_idx, sched_time)
 		self.compSteps[server].insert(comp_steps_idx, fname) 
+		self.stepSets[server].add(fname)
+		self.scheduled.add(fname)
+
+		if self.journal is not None:
+			self.journal.append((fname, server, sched_time, sched_file, comp_steps_idx, old_avail, old_curr_time,
+								old_gap, interval_change, was_in_server, was_scheduled))
 
 def loadSolution(fname: str, instance: Instance) -> Solution:
 	with open(fname) as fp:
@@ -209,4 +389,6 @@ def loadSolution(fname: str, instance: Instance) -> Solution:
 			assert(name in instance.files)
 			assert(server >= 0 and server < instance.nservers)
 			sol.compSteps[server].append(name)
+			sol.stepSets[server].add(name)
+			sol.scheduled.add(name)
 		return sol
@@ -1,133 +1,184 @@
-import copy
 from instance import *
 from solution import *
-from itertools import product, chain
+from itertools import product
 from mip import *
 from progress import *
+from closure import ClosureIndex
+from bounds import CriticalPathBounds
+from improve import improve_solution
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from subcache import SubInstanceCache
+import telemetry
+import time
+import heapq
+from collections import deque
+from budget import TimeBudget
+from heuristic import vectorized_list_schedule
+from cluster import cluster_targets
+from checkpoint import Checkpoint
 
 N_FILES_THRESHOLD = 10 #75
 MAX_SEC_OVERALL = 40  # secods
 MAX_SEC_SAME_INCUMBENT = 30  # seconds
+VECTORIZED_MIN_SERVERS = 50  # below this, the array kernel of the heuristic does not pay off
 
-def optimally_solve_sub_instance(sub_instance: SubInstance, init_solution: Solution = None):
+def optimally_solve_sub_instance(sub_instance: SubInstance, init_solution: Solution = None,
+                                 max_seconds: float = MAX_SEC_OVERALL,
+                                 max_seconds_same_incumbent: float = MAX_SEC_SAME_INCUMBENT):
     """
     This function solves in an optimal manner a sub-instance of the original problem 
     by formulating it as a MIP problem and the solving it with the Python-MIP library.
+    The model is kept sparse: start times are bounded by the latest instant each file can start for the
+    target to meet its deadline, each big-M constant is derived from these bounds, and the
+    non-concurrency disjunctions (and their y variables) are only added for pairs of files
+    which are not already ordered by their dependencies.
+    NOTE: earliest-start lower bounds are only used to detect hopeless sub-instances, as passing them
+          to CBC turned out to slow down the search considerably.
 
     Args:
         sub_instance (SubInstance): the sub-instance to be solved
+        init_solution (Solution): a feasible solution used as a warm start, if any
+        max_seconds (float): time limit of the search
+        max_seconds_same_incumbent (float): the search stops if the incumbent does not improve for this long
+
+    Returns [found, solution, optimal]: whether a solution was found, the solution itself and
+    whether it was proven optimal.
     """
 
-    # create the MIP model
-    model = Model('SingleTargetSubproblem')
     s = sub_instance.nservers   # number of servers
     f = len(sub_instance.filesList)  # numbers of files to compile
+    files = sub_instance.filesList
+    ctime = [file.ctime for file in files]
+    rtime = [file.rtime for file in files]
+    deps = [[sub_instance.filesIdx[dep] for dep in file.dependencies] for file in files]
+    earliest, latest = sub_instance.get_time_windows()
+    ancestors = sub_instance.get_ancestors()
+
+    solution = Solution(s)
+    if any(earliest[j] > latest[j] for j in range(f)):
+        telemetry.count('mip.hopeless')
+        return [False, solution, False]    # the target can not be compiled in time
+
+    # create the MIP model
+    model = Model('SingleTargetSubproblem')
 
     # dummy variable representing the compilation time of the target
-    z = model.add_var(name="z")
+    z = model.add_var(name="z", ub=sub_instance.get_deadline())
     # binary variables indicating WHETHER to schedule file f on server s
     x = [[model.add_var(var_type=BINARY, name='x({},{})'.format(j+1, i+1))
           for i in range(s)] for j in range(f)]   # inverse order
     # variables indicating WHEN to schedule file f on server s
-    t = [[model.add_var(name='t({},{})'.format(j+1, i+1))
+    t = [[model.add_var(name='t({},{})'.format(j+1, i+1), ub=latest[j])
           for i in range(s)] for j in range(f)]
-    # dummy variable representing whether t_{f, s} < t_{f', s}
-    y = [[model.add_var(var_type=BINARY, name='y({},{})'.format(i+1, j+1))
-          for j in range(f)] for i in range(f)]
-
-    bigM = 1.5 * (sum([file.ctime for file in sub_instance.filesList])
-                  + sum([file.rtime for file in sub_instance.filesList]))
-
-    # constraints to try and reduce the computational load
-    model += z <= sub_instance.get_deadline()
-    for (i, j) in product(range(f), range(s)):
-        model += t[i][j] <= sub_instance.get_deadline()
+    # dummy variable representing whether file j is compiled before file k (j < k), for the pairs
+    # of files whose order is not already fixed by the dependencies
+    y = {}
+    for (j, k) in product(range(f), range(f)):
+        if j < k and not (ancestors[j] >> k) & 1 and not (ancestors[k] >> j) & 1:
+            y[j, k] = model.add_var(var_type=BINARY, name='y({},{})'.format(j+1, k+1))
 
     # definition of the dummy objective
     for (i, j) in product(range(f), range(s)):
-        model += z >= t[i][j] - bigM*(1 - x[i][j])
+        bigM = latest[i]
+        if bigM > 0:
+            model.add_constr(z >= t[i][j] - bigM*(1 - x[i][j]))
 
-    # dependency constraint on same server
+    # dependency constraints, on the same and on different servers
     for j in range(f):
-        deps = sub_instance.filesList[j].dependencies
-        for dep in deps:
-            for i in range(s):
-                ctime, _, idx = sub_instance.get_times_and_idx(dep)
-                model += t[j][i] >= t[idx][i] + ctime - \
-                    bigM*(2 - x[j][i] - x[idx][i])
-
-    # dependency constraint on different server
-    for j in range(f):
-        deps = sub_instance.filesList[j].dependencies
-        for dep in deps:
+        for d in deps[j]:
             for (i, k) in product(range(s), range(s)):
-                if (i != k):  # if different servers
-                    ctime, rtime, idx = sub_instance.get_times_and_idx(dep)
-                    model += t[j][i] >= t[idx][k] + ctime + \
-                        rtime - bigM*(2 - x[j][i] - x[idx][k])
+                delay = ctime[d] + (rtime[d] if i != k else 0)
+                bigM = latest[d] + delay
+                if bigM > 0:
+                    model.add_constr(t[j][i] >= t[d][k] + delay - bigM*(2 - x[j][i] - x[d][k]))
 
     # all files must be compiled
     for i in range(f):
-        model += xsum(x[i][j] for j in range(s)) >= 1
-
-    # non-concurrent compilation, case t_{f, s} >= t_{f', s}
-    for (j, k) in product(range(f), range(f)):
-        if (j != k):
-            for i in range(s):
-                model += t[j][i] >= t[k][i] + sub_instance.filesList[k].ctime - \
-                    bigM*(3 - x[j][i] - x[k][i] - (1 - y[j][k]))
-
-    # non-concurrent compilation, case t_{f, s} < t_{f', s}
-    for (j, k) in product(range(f), range(f)):
-        if (j != k):
-            for i in range(s):
-                model += t[k][i] >= t[j][i] + sub_instance.filesList[j].ctime - \
-                    bigM*(3 - x[j][i] - x[k][i] - y[j][k])
+        model.add_constr(xsum(x[i][j] for j in range(s)) >= 1)
+
+    # non-concurrent compilation: either j before k (y = 1) or k before j (y = 0), when both are on server i
+    for (j, k), y_jk in y.items():
+        bigM_jk = latest[j] + ctime[j]
+        bigM_kj = latest[k] + ctime[k]
+        for i in range(s):
+            if bigM_jk > 0:
+                model.add_constr(t[k][i] >= t[j][i] + ctime[j] - bigM_jk*(3 - x[j][i] - x[k][i] - y_jk))
+            if bigM_kj > 0:
+                model.add_constr(t[j][i] >= t[k][i] + ctime[k] - bigM_kj*(2 - x[j][i] - x[k][i] + y_jk))
 
     if(init_solution is not None):
         # set initial feasible solution to speedup the B&C algorithm
         x_start = [[0] * f for _ in range(s)]
         t_start = [[0] * f for _ in range(s)]
-        y_start = [[0] * f for _ in range(f)]
+        y_start = {}
 
         # set values for x variables
         for s_idx in range(s):
             for step in init_solution.compSteps[s_idx]:
-                ctime, _, f_idx = sub_instance.get_times_and_idx(step)
+                f_idx = sub_instance.filesIdx[step]
                 x_start[s_idx][f_idx] = 1
-                t_start[s_idx][f_idx] = init_solution.filesAvailTime[s_idx][step] - ctime
+                t_start[s_idx][f_idx] = init_solution.getSchedTime(step, s_idx)
 
-            for (i, j) in product(range(f), range(f)):
-                if (i != j and x_start[s_idx][i] == 1 and x_start[s_idx][j] == 1):
-                    cond = t_start[s_idx][i] > t_start[s_idx][j]
-                    y_start[i][j] = int(cond)
+            for (j, k) in y:
+                if (x_start[s_idx][j] == 1 and x_start[s_idx][k] == 1):
+                    y_start[j, k] = int(t_start[s_idx][j] < t_start[s_idx][k])
 
         x_start_vars = [(x[k][j], x_start[j][k])
                         for (j, k) in product(range(s), range(f))]
-        y_start_vars = [(y[k][j], y_start[j][k])
-                        for (j, k) in product(range(f), range(f))]
+        y_start_vars = [(y[j, k], y_start.get((j, k), 0)) for (j, k) in y]
         model.start = x_start_vars + y_start_vars
 
     model.verbose = 0
     model.objective = z
-    status = model.optimize(max_seconds_same_incumbent=MAX_SEC_SAME_INCUMBENT,
-                            max_seconds=MAX_SEC_OVERALL)  # set a worst-case limit to the solver runtime
+    model.store_search_progress_log = telemetry.enabled()
+    with telemetry.span('mip', target=sub_instance.target, files=f, cols=model.num_cols, rows=model.num_rows) as sp:
+        status = model.optimize(max_seconds_same_incumbent=max_seconds_same_incumbent,
+                                max_seconds=max_seconds)  # set a worst-case limit to the solver runtime
+        if telemetry.enabled():
+            # CBC does not expose the number of explored nodes through Python-MIP
+            sp.set(status=status.name, solutions=model.num_solutions, objective=model.objective_value,
+                   bound=model.objective_bound, time_to_incumbent=time_to_incumbent(model))
     found = False
-    solution = Solution(s)
+    optimal = status == OptimizationStatus.OPTIMAL
 
     if (status == OptimizationStatus.OPTIMAL or
             status == OptimizationStatus.FEASIBLE):
         found = True
-        obj = int(z.x)
 
         # output the solution
         for (j, i) in product(range(f), range(s)):
             if (x[j][i].x >= 0.99):
                 fname = sub_instance.filesList[j].name
-                time = int(t[j][i].x) 
+                time = int(round(t[j][i].x))
                 solution.recordNewCompilation(sub_instance, time, i, fname)
 
-    return [found, solution]
+    return [found, solution, optimal]
+
+
+def is_consistent(sub_instance: SubInstance, solution: Solution) -> bool:
+    """
+    Checks that the compilation times recorded in a solution are feasible: no overlapping compilations
+    on a server, and every file starts only once all its dependencies are available on its server.
+
+    Args:
+        sub_instance (SubInstance): the sub-instance the solution refers to
+        solution (Solution): the solution to check
+    """
+    for server in range(solution.nservers):
+        time = 0
+        for step in solution.compSteps[server]:
+            stime = solution.getSchedTime(step, server)
+            if stime < time:
+                return False
+            time = stime + sub_instance.filesDict[step].ctime
+    for (fname, server), stime in solution.filesCompTimeDict.items():
+        for dep in sub_instance.filesDict[fname].dependencies:
+            cf = sub_instance.filesDict[dep]
+            avail = [solution.filesCompTimeDict[(dep, s)] + cf.ctime + (cf.rtime if s != server else 0)
+                     for s in range(solution.nservers) if (dep, s) in solution.filesCompTimeDict]
+            if not avail or min(avail) > stime:
+                return False
+    return True
 
 
 def heuristically_solve_sub_instance(sub_instance: SubInstance) -> Solution:
@@ -139,6 +190,10 @@ def heuristically_solve_sub_instance(sub_instance: SubInstance) -> Solution:
     Args:
         sub_instance (SubInstance): the sub-instance to be solved.
     """
+    if sub_instance.nservers >= VECTORIZED_MIN_SERVERS:
+        # same schedule, with the servers scanned as arrays
+        return vectorized_list_schedule(sub_instance)
+
     heuristic_sol = Solution(sub_instance.nservers)
 
     for file in sub_instance.filesList:
@@ -149,6 +204,19 @@ def heuristically_solve_sub_instance(sub_instance: SubInstance) -> Solution:
     return heuristic_sol
 
 
+def time_to_incumbent(model: Model) -> float:
+    """
+    Returns the time (in seconds) the best solution of an optimized model was found at, according to
+    its search progress log (None if it is not available).
+    """
+    if model.objective_value is None:
+        return None
+    for elapsed, (lb, ub) in model.search_progress_log.log:
+        if ub <= model.objective_value + 1e-6:
+            return elapsed
+    return None
+
+
 def merge_sub_instances(sub_inst_a: SubInstance, sol_a: Solution, sub_inst_b: SubInstance, sol_b: Solution) -> Solution:
     """
     This class marges the solutions of two sub-instances into a single solution
@@ -162,35 +230,346 @@ def merge_sub_instances(sub_inst_a: SubInstance, sol_a: Solution, sub_inst_b: Su
 
     assert(sub_inst_a.nservers == sub_inst_b.nservers
            == sol_a.nservers == sol_b.nservers)
-    s = sub_inst_a.nservers
-    tf = sub_inst_b.filesDict[sub_inst_b.target]
-    sol_a_old = copy.deepcopy(sol_a)
-
-    for sched_file in sol_b.filesCompTimeList:
-        flat_steps = list(chain(*sol_a.compSteps))
-        if(sched_file.fname not in flat_steps):
-            earliest_s = sol_a.get_earliest_server_for_file(sched_file.fname, sub_inst_b)
-            sol_a.add_step(sched_file.fname, earliest_s, sub_inst_b)
 
-    # did we manage to compile the target in time? if not, remove the new compilations
-    t_aval_time = min([sol_a.filesAvailTime[i][tf.name] for i in range(s)])
-    if (t_aval_time > sub_inst_b.get_deadline()):
-        sol_a = sol_a_old
+    # the targets of a cluster are merged one at a time (in the order they were scheduled in), each with
+    # the files of its closure still missing, so that only the files of the targets in time are kept
+    for target in sub_inst_b.targets:
+        needed = sub_inst_b.get_closure(target) if len(sub_inst_b.targets) > 1 else sub_inst_b.filesDict
+        sol_a.checkpoint()
+
+        for sched_file in sol_b.filesCompTimeList:
+            if(sched_file.fname not in sol_a.scheduled and sched_file.fname in needed):
+                earliest_s = sol_a.get_earliest_server_for_file(sched_file.fname, sub_inst_b)
+                sol_a.add_step(sched_file.fname, earliest_s, sub_inst_b)
+
+        # did we manage to compile the target in time? if not, remove the new compilations
+        t_aval_time = sol_a.earliestAvailTime(target)
+        if (t_aval_time > sub_inst_b.filesDict[target].deadline):
+            sol_a.rollback()
+            telemetry.count('merge.rolled_back')
+        else:
+            sol_a.commit()
+            telemetry.count('merge.accepted')
 
     return sol_a
 
 
-def rec_load_dependencies(instance: Instance, file: CompiledFile) -> "list[str]":
-    dependencies = []
-    for dep in instance.files[file].dependencies:
-        dependencies.append(instance.files[dep])
-        if (len(instance.files[dep].dependencies) > 0):
-            dependencies.extend(rec_load_dependencies(instance, dep))
+def target_finish(sub_instance: SubInstance, solution: Solution) -> int:
+    """
+    Returns the time the target of a sub-instance is ready in a solution of it.
+    """
+    return solution.earliestAvailTime(sub_instance.target)
+
+
+def sub_instance_score(sub_instance: SubInstance, solution: Solution) -> int:
+    """
+    Returns how many points a solution of a sub-instance is worth: the weighted sum over its targets (just
+    one, unless it is a cluster) of the points of those in time plus their distance from the deadline.
+    """
+    return sub_instance.get_score([solution.earliestAvailTime(target) for target in sub_instance.targets])
+
+
+def is_better(sub_instance: SubInstance, solution: Solution, other: Solution) -> bool:
+    """
+    Whether solution is better than other: its target is ready earlier or, for a cluster, it is worth more points.
+    """
+    if len(sub_instance.targets) > 1:
+        return sub_instance_score(sub_instance, solution) > sub_instance_score(sub_instance, other)
+    return target_finish(sub_instance, solution) < target_finish(sub_instance, other)
+
+
+def mip_eligible(sub_instance: SubInstance) -> bool:
+    """
+    Whether a sub-instance is small enough for the MIP, which handles a single target only.
+    """
+    return len(sub_instance.filesList) < N_FILES_THRESHOLD and len(sub_instance.targets) == 1
 
-    return dependencies
 
+def solve_sub_instance(sub_problem: SubInstance, cache: SubInstanceCache = None, lower_bound: int = None) -> Solution:
+    """
+    This function solves a single sub-instance: heuristically first and then, if it is small enough,
+    via the MIP formulation (warm-started with the best solution known so far).
+    If a cache is given, it is looked up first: an optimal cached schedule (or any cached schedule,
+    for sub-instances too big for the MIP) is returned straight away, while a non-optimal one
+    competes with the heuristic as the warm start. The best schedule found is then stored back.
+    The MIP is skipped when the schedule already reaches the lower bound on the finish time of the target.
+    It is a module-level function so that it can be shipped to worker processes.
 
-def solve_instance(instance: Instance) -> Solution:
+    Args:
+        sub_problem (SubInstance): the sub-instance to be solved
+        cache (SubInstanceCache): cache of the already solved sub-instances, if any
+        lower_bound (int): lower bound on the finish time of the target (see CriticalPathBounds), if known
+    """
+
+    with telemetry.span('target', target=sub_problem.target, closure_size=len(sub_problem.filesList)) as sp:
+        use_mip = mip_eligible(sub_problem)
+        cached, optimal = cache.get(sub_problem) if cache is not None else [None, False]
+        if cached is not None and (optimal or not use_mip):
+            sp.set(source='cache', finish=target_finish(sub_problem, cached))
+            return cached
+
+        sub_pr_solution = heuristically_solve_sub_instance(sub_problem)
+        source = 'heuristic'
+        heur_t = target_finish(sub_problem, sub_pr_solution)
+        sp.set(heuristic_finish=heur_t)
+        if cached is not None and is_better(sub_problem, cached, sub_pr_solution):
+            sub_pr_solution = cached
+            source = 'cache'
+        if use_mip and lower_bound is not None and target_finish(sub_problem, sub_pr_solution) <= lower_bound:
+            use_mip = False     # already optimal
+            optimal = True
+        if use_mip:
+            [found, mip_solution, optimal] = optimally_solve_sub_instance(
+                sub_problem, sub_pr_solution)
+            if found: # did we obtain a better solution? if so, use the MIP one
+                heur_t = target_finish(sub_problem, sub_pr_solution)
+                mip_t = target_finish(sub_problem, mip_solution)
+                sp.set(mip_finish=mip_t, mip_optimal=optimal)
+                if  mip_t < heur_t and is_consistent(sub_problem, mip_solution):
+                    sub_pr_solution = mip_solution
+                    source = 'mip'
+        sp.set(source=source, finish=target_finish(sub_problem, sub_pr_solution))
+
+        #check no overlapping compilations (and respected dependencies)
+        assert(is_consistent(sub_problem, sub_pr_solution))
+
+        if cache is not None:
+            cache.put(sub_problem, sub_pr_solution, optimal)
+        return sub_pr_solution
+
+
+def initial_sub_solution(sub_problem: SubInstance, cache: SubInstanceCache = None):
+    """
+    Returns [solution, optimal] for a sub-instance without running the MIP: an optimal cached schedule
+    if there is one, otherwise the best of the heuristic schedule and the cached one (if any).
+    """
+    with telemetry.span('target', target=sub_problem.target, closure_size=len(sub_problem.filesList)) as sp:
+        cached, optimal = cache.get(sub_problem) if cache is not None else [None, False]
+        if cached is not None and optimal:
+            sp.set(source='cache', finish=target_finish(sub_problem, cached))
+            return [cached, True]
+        solution = heuristically_solve_sub_instance(sub_problem)
+        sp.set(heuristic_finish=target_finish(sub_problem, solution), source='heuristic')
+        if cached is not None and is_better(sub_problem, cached, solution):
+            solution = cached
+            sp.set(source='cache')
+        return [solution, False]
+
+
+def improve_sub_instance(sub_problem: SubInstance, solution: Solution, max_seconds: float):
+    """
+    Runs the MIP on a sub-instance for at most max_seconds, warm-started with solution.
+    Returns [solution, optimal, elapsed seconds], where solution is the MIP one only if it is better.
+    """
+    start = time.time()
+    [found, mip_solution, optimal] = optimally_solve_sub_instance(
+        sub_problem, solution, max_seconds, min(MAX_SEC_SAME_INCUMBENT, max_seconds))
+    if found and target_finish(sub_problem, mip_solution) < target_finish(sub_problem, solution) \
+            and is_consistent(sub_problem, mip_solution):
+        solution = mip_solution
+    return [solution, optimal, time.time() - start]
+
+
+def mip_gain(sub_instance: SubInstance, solution: Solution, lower_bound: int = None) -> int:
+    """
+    Returns how many points the MIP could gain at most over the given solution of a sub-instance:
+    the distance between the finish time of the target and its lower bound (the longest chain of
+    compilations ending with it, unless a tighter lower_bound is given), plus the points of the target
+    if the solution misses the deadline.
+    It is 0 if the target can not be compiled in time at all, or if the solution is already optimal.
+    """
+    if lower_bound is None:
+        earliest, _ = sub_instance.get_time_windows()
+        target_idx = sub_instance.filesIdx[sub_instance.target]
+        lower_bound = earliest[target_idx] + sub_instance.filesList[target_idx].ctime
+    deadline = sub_instance.get_deadline()
+    finish = target_finish(sub_instance, solution)
+    if lower_bound > deadline or finish <= lower_bound:
+        return 0
+    if finish > deadline:
+        return deadline - lower_bound + sub_instance.get_compil_points()
+    return finish - lower_bound
+
+
+def solve_sub_instances_with_budget(sub_inst: "list[SubInstance]", time_budget: TimeBudget,
+                                    workers: int = 1, cache: SubInstanceCache = None,
+                                    lower_bounds: "list[int]" = None, on_solved=None,
+                                    initial: "list[Solution]" = None) -> "list[Solution]":
+    """
+    Solves the sub-instances within a time budget: all of them are first solved heuristically, then the
+    budget is spent on the MIP of the small ones, by decreasing expected gain (see mip_gain and TimeBudget).
+    A MIP stopped by its time limit before proving optimality is queued again, with at least twice its
+    previous slice, in case time is freed later on.
+
+    Args:
+        sub_inst (list[SubInstance]): the sub-instances to solve
+        time_budget (TimeBudget): the budget the MIP runs are scheduled within
+        workers (int): number of worker processes (1 = no pool)
+        cache (SubInstanceCache): cache of the already solved sub-instances, if any
+        lower_bounds (list[int]): lower bounds on the finish time of the targets, if known
+        on_solved (callable): if given, called as on_solved(i, solution) as soon as a schedule of the i-th
+            sub-instance is found: the heuristic one first, then each one found by the MIP
+        initial (list[Solution]): if given, schedules to start from instead of the heuristic ones (None for the
+            sub-instances without one), e.g. those of an interrupted run
+    """
+    if lower_bounds is None:
+        lower_bounds = [None] * len(sub_inst)
+    sub_sol = list(initial) if initial is not None else [None] * len(sub_inst)
+    optimal = [False] * len(sub_inst)
+    missing = [i for i in range(len(sub_inst)) if sub_sol[i] is None]
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if executor is not None:
+            first = executor.map(initial_sub_solution, [sub_inst[i] for i in missing], [cache] * len(missing))
+        else:
+            first = (initial_sub_solution(sub_inst[i], cache) for i in missing)
+        for i, (solution, opt) in zip(missing, first):
+            sub_sol[i] = solution
+            optimal[i] = opt
+            if on_solved is not None:
+                on_solved(i, solution)
+        for i, sub in enumerate(sub_inst):
+            if lower_bounds[i] is not None and target_finish(sub, sub_sol[i]) <= lower_bounds[i]:
+                optimal[i] = True
+            if mip_eligible(sub) and not optimal[i]:
+                time_budget.add(i, mip_gain(sub, sub_sol[i], lower_bounds[i]))
+
+        running = {}
+        while True:
+            while len(running) < workers:
+                task = time_budget.next()
+                if task is None:
+                    break
+                i, seconds = task
+                if executor is not None:
+                    running[executor.submit(improve_sub_instance, sub_inst[i], sub_sol[i], seconds)] = [i, seconds]
+                else:
+                    running[i] = [i, seconds]
+            if not running:
+                break
+            if executor is not None:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                results = [(running.pop(future), future.result()) for future in finished]
+            else:
+                i, seconds = running.popitem()[1]
+                results = [([i, seconds], improve_sub_instance(sub_inst[i], sub_sol[i], seconds))]
+            for (i, seconds), (solution, opt, elapsed) in results:
+                time_budget.done(i)
+                sub_sol[i] = solution
+                optimal[i] = opt
+                if on_solved is not None:
+                    on_solved(i, solution)
+                if not opt and elapsed >= 0.9 * seconds:
+                    # stopped by the time limit: worth another try if there is more time later
+                    telemetry.count('budget.requeued')
+                    time_budget.add(i, mip_gain(sub_inst[i], solution, lower_bounds[i]), at_least=2 * seconds)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    for i, sub in enumerate(sub_inst):
+        assert(is_consistent(sub, sub_sol[i]))
+        if cache is not None:
+            cache.put(sub, sub_sol[i], optimal[i])
+    return sub_sol
+
+
+def build_sub_instance(closure_index: ClosureIndex, bounds: CriticalPathBounds, cluster: "list[str]"):
+    """
+    Returns [sub-instance, lower bound on the finish time of its target] for a cluster of targets (a single
+    target being the common case); clusters of several targets have no lower bound.
+    """
+    if len(cluster) == 1:
+        return [closure_index.sub_instance(cluster[0]),
+                bounds.finish_lower_bound(closure_index.instance.fileIds[cluster[0]])]
+    return [closure_index.cluster_sub_instance(cluster), None]
+
+
+def stream_sub_solutions(jobs, workers: int = 1, cache: SubInstanceCache = None):
+    """
+    Yields [sub-instance, solution] for each [sub-instance, lower bound] of the jobs iterable, in the same order.
+    Jobs are only taken from the iterable as needed: with several workers, at most workers + 1 of them
+    are submitted to the pool and not yet yielded.
+    """
+    if workers <= 1:
+        for sub_problem, lower_bound in jobs:
+            yield [sub_problem, solve_sub_instance(sub_problem, cache, lower_bound)]
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for sub_problem, lower_bound in jobs:
+            in_flight.append([sub_problem, executor.submit(solve_sub_instance, sub_problem, cache, lower_bound)])
+            if len(in_flight) > workers:
+                sub_problem, future = in_flight.popleft()
+                yield [sub_problem, future.result()]
+        while in_flight:
+            sub_problem, future = in_flight.popleft()
+            yield [sub_problem, future.result()]
+
+
+def solve_stream(instance: Instance, closure_index: ClosureIndex, bounds: CriticalPathBounds,
+                 clusters: "list[list[str]]", window: int, workers: int = 1,
+                 cache: SubInstanceCache = None) -> Solution:
+    """
+    Streaming version of the solve and merge stages of solve_instance, keeping memory bounded: the clusters
+    (single targets by default) are ranked by a cheap estimate of their score, the sum of the upper bounds
+    of their targets (see CriticalPathBounds), and their sub-instances are built and solved one at a time
+    in that order. Solved sub-instances wait in a look-ahead window of at most window entries, out of which
+    the best scoring one is merged (and dropped) whenever a new one comes in, so that the merge order can
+    still correct the estimate. Sub-instances worth no points are dropped without merging.
+
+    Args:
+        instance (Instance): the instance being solved
+        closure_index (ClosureIndex): the closure index of the instance
+        bounds (CriticalPathBounds): the bounds computed on the closure index
+        clusters (list[list[str]]): the targets (grouped in clusters) to solve
+        window (int): maximum number of solved sub-instances waiting to be merged
+        workers (int): number of worker processes solving the sub-instances (1 = no pool)
+        cache (SubInstanceCache): persistent cache of solved sub-instances, if any
+    """
+    inst = closure_index.instance
+    estimate = [sum(bounds.score_upper_bound(inst.fileIds[target]) for target in cluster) for cluster in clusters]
+    order = sorted(range(len(clusters)), key=lambda i: -estimate[i])
+    jobs = (build_sub_instance(closure_index, bounds, clusters[i]) for i in order)
+    total = len(clusters) * 2
+    counter = 0
+    waiting = []    # heap of [-score, arrival, sub-instance, solution]
+    solution = None
+
+    def merge_best():
+        nonlocal solution, counter
+        score, _, sub_problem, sub_pr_solution = heapq.heappop(waiting)
+        progress(counter, total, f'{instance.name} - merging subinstance')
+        if -score <= 0:  # skip subproblems we couldn't solve
+            telemetry.count('merge.skipped')
+        elif solution is None:
+            solution = sub_pr_solution
+        else:
+            solution = merge_sub_instances(sub_problem, solution, sub_problem, sub_pr_solution)
+        counter = counter + 1
+
+    with telemetry.span('stream', instance=instance.name, window=window, workers=workers, units=len(clusters)):
+        progress(0, total, '')
+        for arrival, (sub_problem, sub_pr_solution) in enumerate(stream_sub_solutions(jobs, workers, cache)):
+            progress(counter, total, f'{instance.name} - solving subinstance')
+            counter = counter + 1
+            heapq.heappush(waiting, [-sub_instance_score(sub_problem, sub_pr_solution), arrival,
+                                     sub_problem, sub_pr_solution])
+            if len(waiting) > window:
+                merge_best()
+        while waiting:
+            merge_best()
+    progress(total, total, f'{instance.name} - solved')
+
+    if solution is None:
+        return Solution(instance.nservers)
+    return solution
+
+
+def solve_instance(instance: Instance, workers: int = 1, cache: SubInstanceCache = None, budget: float = None,
+                   improve_seconds: float = None, improve_iterations: int = None,
+                   cluster_threshold: float = None, stream_window: int = None,
+                   checkpoint: Checkpoint = None) -> Solution:
     """
     This class solves an instance of the Hash Code 2019 final problem by splitting the original problem
     into multiple subproblems, each comprising a single target file.
@@ -200,88 +579,132 @@ def solve_instance(instance: Instance) -> Solution:
 
     Args:
         instance (Instance): the Hash Code 2019 final instance to solve
+        workers (int): number of worker processes solving the subproblems in parallel (1 = no pool).
+            Results are collected in target order, so the merged solution does not depend on it.
+        cache (SubInstanceCache): persistent cache of solved sub-instances, if any
+        budget (float): if given, the run is meant to last about this many seconds: the time of the MIP runs is
+            scheduled within it (see solve_sub_instances_with_budget) instead of using fixed per-MIP limits
+        improve_seconds (float): if given, the merged solution is improved by local search for this many seconds
+        improve_iterations (int): if given, the merged solution is improved by local search for this many edits
+        cluster_threshold (float): if given, targets whose closures overlap (Jaccard similarity) more than this
+            are grouped into clusters (see cluster_targets), each solved once as a multi-target subproblem
+            (heuristically, scored by sub_instance_score), so that shared dependencies are scheduled once
+        stream_window (int): if given, the sub-instances are built, solved and merged one at a time, with a
+            look-ahead window of this many solved sub-instances (see solve_stream), instead of all being
+            kept until the merge; it can not be combined with budget
+        checkpoint (Checkpoint): if given, the progress of the run is saved to it (and resumed from it): sub-instances
+            solved by a previous run are not solved again (with a budget, their schedules are the starting point
+            of the MIP runs instead of the heuristic ones), and the merge goes on from where it stopped.
+            It can not be combined with stream_window
     """
+    assert(stream_window is None or (budget is None and checkpoint is None))
 
-    num_targets = len(instance.targets)
+    time_budget = TimeBudget(budget, workers) if budget is not None else None
     sub_sol, sub_inst = [], []
+    lower_bounds = []   # lower bound on the finish time of the target of each sub-instance
+    with telemetry.span('extract', instance=instance.name, targets=len(instance.targets)) as sp:
+        closure_index = ClosureIndex(instance)
+        bounds = CriticalPathBounds(closure_index)
+
+        targets = []
+        for target in instance.targets:
+            assert(target in instance.files)
+            fid = closure_index.instance.fileIds[target]
+            if not bounds.hopeless(fid):
+                targets.append(target)
+            # otherwise the target can never meet its deadline: no need to solve it
+        sp.set(pruned=len(instance.targets) - len(targets))
+
+        if cluster_threshold is not None:
+            clusters = cluster_targets(closure_index, targets, cluster_threshold)
+            sp.set(clusters=len(clusters))
+        else:
+            clusters = [[target] for target in targets]
+        for cluster in clusters if stream_window is None else []:
+            # create sub-problem
+            sub_problem, lower_bound = build_sub_instance(closure_index, bounds, cluster)
+            sub_inst.append(sub_problem)
+            lower_bounds.append(lower_bound)
+
+    if stream_window is not None:
+        solution = solve_stream(instance, closure_index, bounds, clusters, stream_window, workers, cache)
+        if improve_seconds is not None or improve_iterations is not None:
+            solution = improve_solution(instance, solution, improve_seconds, improve_iterations)
+        return solution
+
+    num_targets = len(sub_inst)
+    if num_targets == 0:
+        return Solution(instance.nservers)
     sol_score = [0] * num_targets   # represents how "good" a solution of a sub-instance is
     progress(0, num_targets*2, '')
-    counter = 0
     delta = []
 
-    for target in instance.targets:
-
-        assert(target in instance.files)
-
-        progress(counter, num_targets*2, f'{instance.name} - solving subinstance')
-
-        # create sub-problem
-        relevant_files_list = [instance.files[target]]
-        dependencies = rec_load_dependencies(instance, target)
-        relevant_files_list.extend(dependencies)
-        relevant_files_list.reverse()   # dependencies first
-        unique_file_list = []
-        for elem in relevant_files_list:
-            already_there = [file.name for file in unique_file_list]
-            if(elem.name not in already_there):
-                unique_file_list.append(elem)
-        relevant_files_dict = {}
-        for file in unique_file_list:
-            relevant_files_dict[file.name] = file
-
-        sub_problem = SubInstance(
-            unique_file_list, relevant_files_dict, target, instance.nservers)
-        sub_pr_solution = heuristically_solve_sub_instance(sub_problem)
-        if (len(unique_file_list) < N_FILES_THRESHOLD):
-            [found, mip_solution] = optimally_solve_sub_instance(
-                sub_problem, sub_pr_solution)
-            if found: # did we obtain a better solution? if so, use the MIP one
-                tf = sub_problem.target
-                heur_t = min([sub_pr_solution.filesAvailTime[j][tf] for j in range(sub_problem.nservers)])
-                mip_t = min([mip_solution.filesAvailTime[j][tf] for j in range(sub_problem.nservers)])
-                if  mip_t < heur_t:
-                    solution = mip_solution
-
-        #check no overlapping compilations
-        for server in range(instance.nservers):
-            time = 0
-            for step in sub_pr_solution.compSteps[server]:
-                stime = sub_pr_solution.getSchedTime(step, server)
-                ctime = sub_problem.filesDict[step].ctime
-                assert(stime >= time)
-                time = stime + ctime
-
-
-        sub_inst.append(sub_problem)
-        sub_sol.append(sub_pr_solution)
-        counter = counter + 1
+    if checkpoint is not None:
+        sub_sol = [checkpoint.sub_solution(sub_problem) for sub_problem in sub_inst]
+    else:
+        sub_sol = [None] * num_targets
+    todo = [i for i in range(num_targets) if sub_sol[i] is None]
+    counter = num_targets - len(todo)
+
+    def solved(i: int, sub_pr_solution: Solution):
+        sub_sol[i] = sub_pr_solution
+        if checkpoint is not None:
+            checkpoint.add_solved(sub_inst[i], sub_pr_solution, sub_instance_score(sub_inst[i], sub_pr_solution))
+
+    with telemetry.span('solve_targets', instance=instance.name, workers=workers, resumed=num_targets - len(todo)):
+        if time_budget is not None:
+            # each schedule is checkpointed as soon as it is found, not once the whole budget is spent; the
+            # resumed ones are only a starting point, the MIP time being shared among all the sub-instances
+            solve_sub_instances_with_budget(sub_inst, time_budget, workers, cache, lower_bounds, solved, sub_sol)
+            counter = num_targets
+        elif workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for i, sub_pr_solution in zip(todo, executor.map(solve_sub_instance, [sub_inst[i] for i in todo],
+                                                                 [cache] * len(todo), [lower_bounds[i] for i in todo])):
+                    progress(counter, num_targets*2, f'{instance.name} - solving subinstance')
+                    solved(i, sub_pr_solution)
+                    counter = counter + 1
+        else:
+            for i in todo:
+                progress(counter, num_targets*2, f'{instance.name} - solving subinstance')
+                solved(i, solve_sub_instance(sub_inst[i], cache, lower_bounds[i]))
+                counter = counter + 1
 
     # sort the targets
     assert(len(sub_sol) == len(sub_inst) == len(sol_score))
     for i in range(len(sub_sol)):
-        tf = sub_inst[i].target
-        s = sub_inst[i].nservers
-        t_aval_time = min([sub_sol[i].filesAvailTime[j][tf] for j in range(s)])
-        deadline = sub_inst[i].get_deadline()
-        if (t_aval_time <= deadline):
-            sol_score[i] = deadline - t_aval_time + \
-                sub_inst[i].get_compil_points()
+        sol_score[i] = sub_instance_score(sub_inst[i], sub_sol[i])
     #print(scores)
 
     # get the indices of the list sorted in descending order
     idxes = np.argsort(np.argsort(sol_score))
 
-    solution = sub_sol[idxes[0]]
-    prev_inst = sub_inst[idxes[0]]
-    for i in range(1, len(sub_sol)):
-        progress(counter, num_targets*2, f'{instance.name} - merging subinstance')
-        if(sol_score[idxes[i]] > 0):  # skip subproblems we couldn't solve
-            solution = merge_sub_instances(
-                prev_inst, solution, sub_inst[idxes[i]], sub_sol[idxes[i]])
-            prev_inst = sub_sol[idxes[i]]
-        counter = counter + 1
+    with telemetry.span('merge', instance=instance.name):
+        solution = sub_sol[idxes[0]]
+        prev_inst = sub_inst[idxes[0]]
+        start = 1
+        resumed = checkpoint.merge_state(instance) if checkpoint is not None else None
+        if resumed is not None:
+            start, solution = resumed
+            counter = counter + start - 1
+        for i in range(start, len(sub_sol)):
+            progress(counter, num_targets*2, f'{instance.name} - merging subinstance')
+            if(sol_score[idxes[i]] > 0):  # skip subproblems we couldn't solve
+                solution = merge_sub_instances(
+                    prev_inst, solution, sub_inst[idxes[i]], sub_sol[idxes[i]])
+                prev_inst = sub_sol[idxes[i]]
+            else:
+                telemetry.count('merge.skipped')
+            counter = counter + 1
+            if checkpoint is not None:
+                checkpoint.merged(i + 1, solution)
+    if checkpoint is not None:
+        checkpoint.save()   # the local search below starts over from the merged schedule, if interrupted
     progress(num_targets*2, num_targets*2, f'{instance.name} - solved')
 
+    if improve_seconds is not None or improve_iterations is not None:
+        solution = improve_solution(instance, solution, improve_seconds, improve_iterations)
+
     # solution = sub_sol[0]
     # prev_inst = sub_inst[0]
     # counter = counter + 1
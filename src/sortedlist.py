@@ -0,0 +1,82 @@
+from bisect import bisect_left
+
+
+class SortedKeyList():
+    """
+    List of values kept sorted by an associated key, stored as a list of small sorted buckets so that
+    inserting a value and finding its position cost O(log n) comparisons plus a small bucket shift,
+    instead of a scan and shift of the whole list. A new value goes before the values with an equal key
+    (as with bisect_left).
+    """
+
+    def __init__(self, load: int = 512):
+        self.load = load
+        self.keys = []      # buckets of keys
+        self.values = []    # buckets of values, parallel to keys
+        self.maxes = []     # largest key of each bucket
+        self.length = 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self):
+        for bucket in self.values:
+            yield from bucket
+
+    def __getitem__(self, idx: int):
+        if idx < 0:
+            idx += self.length
+        if idx < 0 or idx >= self.length:
+            raise IndexError('SortedKeyList index out of range')
+        for bucket in self.values:
+            if idx < len(bucket):
+                return bucket[idx]
+            idx -= len(bucket)
+
+    def insert(self, key, value):
+        """
+        Inserts value with the given key, before any value with an equal key.
+        """
+        self.length += 1
+        if not self.maxes:
+            self.keys.append([key])
+            self.values.append([value])
+            self.maxes.append(key)
+            return
+        b = bisect_left(self.maxes, key)
+        if b == len(self.maxes):
+            b -= 1
+        keys, values = self.keys[b], self.values[b]
+        i = bisect_left(keys, key)
+        keys.insert(i, key)
+        values.insert(i, value)
+        self.maxes[b] = keys[-1]
+        if len(keys) > 2 * self.load:
+            # split the bucket in half
+            self.keys[b:b+1] = [keys[:self.load], keys[self.load:]]
+            self.values[b:b+1] = [values[:self.load], values[self.load:]]
+            self.maxes[b:b+1] = [keys[self.load - 1], keys[-1]]
+
+    def remove(self, key, value):
+        """
+        Removes value (compared by identity), which must have been inserted with the given key.
+        """
+        b = bisect_left(self.maxes, key)
+        while b < len(self.maxes):
+            keys, values = self.keys[b], self.values[b]
+            i = bisect_left(keys, key)
+            while i < len(keys) and keys[i] == key:
+                if values[i] is value:
+                    del keys[i]
+                    del values[i]
+                    self.length -= 1
+                    if keys:
+                        self.maxes[b] = keys[-1]
+                    else:
+                        del self.keys[b]
+                        del self.values[b]
+                        del self.maxes[b]
+                    return
+                i += 1
+            b += 1
+        raise ValueError('value not in SortedKeyList')
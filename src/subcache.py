@@ -0,0 +1,104 @@
+import os
+import json
+import hashlib
+from instance import *
+from solution import *
+
+
+def canonical_hash(sub_instance: SubInstance) -> str:
+    """
+    Returns a hash identifying a sub-instance up to the names of its files: files are relabelled by
+    their position in filesList, and the hash covers the DAG shape, ctime/rtime of each file,
+    the target, its deadline and the number of servers (and, for a cluster, the other targets with their
+    deadlines and points, which its score depends on).
+
+    Args:
+        sub_instance (SubInstance): the sub-instance to hash
+    """
+    files = [[cf.ctime, cf.rtime, [sub_instance.filesIdx[dep] for dep in cf.dependencies]]
+             for cf in sub_instance.filesList]
+    canonical = [sub_instance.nservers, sub_instance.filesIdx[sub_instance.target],
+                 sub_instance.get_deadline(), files]
+    if len(sub_instance.targets) > 1:
+        canonical.append([[sub_instance.filesIdx[target], sub_instance.filesDict[target].deadline,
+                           sub_instance.filesDict[target].points] for target in sub_instance.targets])
+    return hashlib.sha256(json.dumps(canonical, separators=(',', ':')).encode()).hexdigest()
+
+
+class SubInstanceCache():
+    """
+    Persistent, content-addressed cache of the best known schedule of each solved sub-instance.
+    Each entry is a JSON file named after the canonical hash of its sub-instance, holding the schedule
+    (as positions in filesList, servers and start times) and whether it is known to be optimal.
+    The cache holds at most max_entries entries; the least recently used ones are evicted first
+    (recency is tracked through the modification time of the entry files).
+
+    Args:
+        path (str): directory holding the cache entries (created if needed)
+        max_entries (int): maximum number of entries kept on disk
+    """
+
+    def __init__(self, path: str = '.subinstance_cache', max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(path, exist_ok=True)
+        self.nentries = len([fn for fn in os.listdir(path) if fn.endswith('.json')])
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, f'{key}.json')
+
+    def get(self, sub_instance: SubInstance):
+        """
+        Returns [solution, optimal] for a cached sub-instance, [None, False] on a miss.
+        """
+        entry_path = self._entry_path(canonical_hash(sub_instance))
+        try:
+            with open(entry_path) as fp:
+                entry = json.load(fp)
+            os.utime(entry_path)    # mark as recently used
+        except (OSError, ValueError):
+            return [None, False]
+        solution = Solution(sub_instance.nservers)
+        # steps are stored in filesCompTimeList order: recording them backwards rebuilds the same order,
+        # since a new step goes before the steps starting at the same time
+        for pos, server, start in reversed(entry['steps']):
+            solution.recordNewCompilation(sub_instance, start, server, sub_instance.filesList[pos].name)
+        return [solution, entry['optimal']]
+
+    def put(self, sub_instance: SubInstance, solution: Solution, optimal: bool):
+        """
+        Stores the schedule of a sub-instance, replacing any previous entry.
+        """
+        entry = {'optimal': bool(optimal),
+                 'steps': [[sub_instance.filesIdx[step.fname], step.server, step.sched_time]
+                           for step in solution.filesCompTimeList]}
+        entry_path = self._entry_path(canonical_hash(sub_instance))
+        existed = os.path.exists(entry_path)
+        tmp_path = f'{entry_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(entry, fp)
+        os.replace(tmp_path, entry_path)
+        if not existed:
+            self.nentries += 1
+            if self.nentries > self.max_entries:
+                self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries, down to 90% of max_entries.
+        """
+        entries = []
+        for fn in os.listdir(self.path):
+            if fn.endswith('.json'):
+                try:
+                    entries.append((os.path.getmtime(os.path.join(self.path, fn)), fn))
+                except OSError:
+                    pass
+        entries.sort()
+        keep = int(self.max_entries * 0.9)
+        for _, fn in entries[:max(0, len(entries) - keep)]:
+            try:
+                os.remove(os.path.join(self.path, fn))
+            except OSError:
+                pass
+        self.nentries = min(len(entries), keep)
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import tempfile
+import threading
+
+
+class Span():
+    """
+    A timed section of the run, with free-form attributes (set at creation or later via set()).
+    It is written out when the with block it opens is left.
+    """
+    __slots__ = ('name', 'attrs', 'start')
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.start = 0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        if _sink is not None:
+            _sink.write({'type': 'span', 'name': self.name, 'ts': self.start // 1000,
+                         'dur': (end - self.start) // 1000, 'attrs': self.attrs})
+        return False
+
+
+class NullSpan():
+    """
+    The span handed out while telemetry is disabled: it does nothing.
+    """
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Sink():
+    """
+    Writes the telemetry records as JSON lines, one write per record: worker processes forked after
+    configure() inherit the (append-mode, line-buffered) file and add their records to it.
+    """
+
+    def __init__(self, jsonl_path: str, chrome_path: str = None):
+        self.temporary = jsonl_path is None
+        if self.temporary:
+            fd, jsonl_path = tempfile.mkstemp(suffix='.jsonl')
+            os.close(fd)
+        else:
+            open(jsonl_path, 'w').close()
+        self.jsonl_path = jsonl_path
+        self.chrome_path = chrome_path
+        self.fp = open(jsonl_path, 'a', buffering=1)
+
+    def write(self, record: dict):
+        record['pid'] = os.getpid()
+        record['tid'] = threading.get_ident()
+        self.fp.write(json.dumps(record, default=str) + '\n')
+
+    def close(self) -> dict:
+        self.fp.close()
+        records = []
+        with open(self.jsonl_path) as fp:
+            for line in fp:
+                records.append(json.loads(line))
+        counters = {}
+        events = []
+        for record in records:
+            if record['type'] == 'span':
+                events.append({'name': record['name'], 'cat': 'solver', 'ph': 'X', 'ts': record['ts'],
+                               'dur': record['dur'], 'pid': record['pid'], 'tid': record['tid'],
+                               'args': record['attrs']})
+            else:
+                counters[record['name']] = counters.get(record['name'], 0) + record['n']
+                events.append({'name': record['name'], 'ph': 'C', 'ts': record['ts'], 'pid': record['pid'],
+                               'args': {record['name']: counters[record['name']]}})
+        if self.chrome_path is not None:
+            with open(self.chrome_path, 'w') as fp:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fp)
+        if self.temporary:
+            os.remove(self.jsonl_path)
+        return counters
+
+
+_sink = None
+
+
+def configure(jsonl_path: str = None, chrome_path: str = None):
+    """
+    Turns telemetry on: records go to jsonl_path (if given) and, when shutdown() is called, they are
+    also converted to a Chrome trace (chrome://tracing, Perfetto, speedscope) at chrome_path (if given).
+    """
+    global _sink
+    if _sink is not None:
+        shutdown()
+    if jsonl_path is not None or chrome_path is not None:
+        _sink = Sink(jsonl_path, chrome_path)
+
+
+def enabled() -> bool:
+    return _sink is not None
+
+
+def span(name: str, **attrs):
+    """
+    Returns a context manager timing a section of the run:
+
+        with telemetry.span('target', target=name) as sp:
+            ...
+            sp.set(finish=finish)
+    """
+    if _sink is None:
+        return NULL_SPAN
+    return Span(name, attrs)
+
+
+def count(name: str, n: int = 1):
+    """
+    Increments a counter by n.
+    """
+    if _sink is not None:
+        _sink.write({'type': 'counter', 'name': name, 'ts': time.perf_counter_ns() // 1000, 'n': n})
+
+
+def shutdown() -> dict:
+    """
+    Turns telemetry off, writing the Chrome trace if requested. Returns the totals of the counters.
+    """
+    global _sink
+    if _sink is None:
+        return {}
+    sink, _sink = _sink, None
+    return sink.close()
@@ -0,0 +1,31 @@
+import os
+import sys
+import random
+import pytest
+
+# the modules of src/ import each other by plain name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from instance import loadInstance
+from generate import generate_instance
+
+
+@pytest.fixture
+def small_instance(tmp_path):
+    """
+    A random instance small enough to be re-simulated after every edit.
+    """
+    path = str(tmp_path / 'small.in')
+    generate_instance(path, nfiles=60, ntargets=8, nservers=3, depth=6, fan_in=3, tightness=3.0, seed=1)
+    return loadInstance(path)
+
+
+def random_schedule(instance, rng: random.Random) -> "list[list[str]]":
+    """
+    Returns compSteps compiling every file once on a random server, in the order of the input (which is
+    topological), so that the schedule can not deadlock.
+    """
+    steps = [[] for s in range(instance.nservers)]
+    for fname in instance.files:
+        steps[rng.randrange(instance.nservers)].append(fname)
+    return steps
@@ -0,0 +1,124 @@
+import random
+import pytest
+from collections import deque
+from instance import CompiledFile, Instance
+from solution import Solution
+
+
+def sweep_score(instance, compSteps: "list[list[str]]") -> int:
+    """
+    The round-robin simulation evalCheck used to run: every server queue is swept again and again until no
+    step can start, and each compiled file is made available on every server. Returns None on a deadlock.
+    """
+    queues = [deque(compSteps[s]) for s in range(instance.nservers)]
+    time = [0] * instance.nservers
+    files = [{} for s in range(instance.nservers)]
+    while True:
+        nDone = 0
+        for s in range(instance.nservers):
+            if not queues[s]:
+                continue
+            cf = instance.files[queues[s][0]]
+            if any(dep not in files[s] for dep in cf.dependencies):
+                continue
+            startTime = max([time[s]] + [files[s][dep] for dep in cf.dependencies])
+            queues[s].popleft()
+            nDone += 1
+            for otherS in range(instance.nservers):
+                afterTime = startTime + cf.ctime + (cf.rtime if otherS != s else 0)
+                files[otherS][cf.name] = min(files[otherS].get(cf.name, afterTime), afterTime)
+            time[s] = startTime + cf.ctime
+        if not nDone:
+            break
+    if any(queues):
+        return None
+    score = 0
+    for t in set().union(*files):
+        cf = instance.files[t]
+        finish = min(files[s][t] for s in range(instance.nservers) if t in files[s])
+        if cf.points > 0 and finish <= cf.deadline:
+            score += (cf.deadline - finish) + cf.points
+    return score
+
+
+def schedule_with_duplicates(instance, rng: random.Random) -> "list[list[str]]":
+    """
+    Returns compSteps compiling every file on one or two random servers, in the order of the input (which is
+    topological), and compiling some files again later on, so that the schedule can not deadlock.
+    """
+    names = list(instance.files)
+    steps = [[] for s in range(instance.nservers)]
+    for idx, fname in enumerate(names):
+        for s in rng.sample(range(instance.nservers), rng.choice([1, 1, 1, 2])):
+            steps[s].append(fname)
+        if idx and rng.random() < 0.1:
+            steps[rng.randrange(instance.nservers)].append(rng.choice(names[:idx]))
+    return steps
+
+
+def tiny_instance() -> Instance:
+    a = CompiledFile('a', 5, 3, [])
+    b = CompiledFile('b', 2, 1, ['a'])
+    c = CompiledFile('c', 4, 2, ['a', 'b'])
+    b.deadline, b.points = 20, 10
+    c.deadline, c.points = 12, 7
+    return Instance({'a': a, 'b': b, 'c': c}, ['b', 'c'], 2, 'tiny')
+
+
+def score(instance, compSteps: "list[list[str]]") -> int:
+    solution = Solution(instance.nservers)
+    solution.compSteps = compSteps
+    return solution.evalCheck(instance)
+
+
+def test_hand_computed_scores():
+    instance = tiny_instance()
+    # a done at 5 (8 on server 1), b at 10: 20-10+10 points
+    assert score(instance, [['a'], ['b']]) == 20
+    # b and c after a on server 0: b done at 7, c at 11
+    assert score(instance, [['a', 'b', 'c'], []]) == (20 - 7 + 10) + (12 - 11 + 7)
+    # c on server 1 waits for a (8) and b (7+1): done at 12, just in time
+    assert score(instance, [['a', 'b'], ['c']]) == (20 - 7 + 10) + (12 - 12 + 7)
+    # compiling a again on server 1 makes it available there at 5 instead of 8
+    assert score(instance, [['a'], ['a', 'b']]) == 20 - 7 + 10
+    # c misses its deadline (done at 14)
+    assert score(instance, [['a'], ['b', 'c']]) == 20 - 10 + 10
+
+
+def test_deadlock_names_the_stuck_step():
+    instance = tiny_instance()
+    with pytest.raises(ValueError, match=r'step 0 of server 1 \(c\) waits for \[\'b\'\]'):
+        score(instance, [['a'], ['c', 'b']])
+    with pytest.raises(ValueError, match='server 0'):
+        score(instance, [['b', 'a'], []])
+
+
+def test_evalcheck_matches_the_round_robin_sweep(small_instance):
+    rng = random.Random(0)
+    for _ in range(200):
+        compSteps = schedule_with_duplicates(small_instance, rng)
+        assert score(small_instance, compSteps) == sweep_score(small_instance, compSteps)
+
+
+def test_evalcheck_raises_where_the_sweep_deadlocks(small_instance):
+    rng = random.Random(1)
+    names = list(small_instance.files)
+    deadlocks = 0
+    for _ in range(200):
+        # a topological order with a few files moved before some of their dependencies (or not)
+        order = list(names)
+        for _ in range(10):
+            i = rng.randrange(len(order) - 5)
+            j = i + rng.randint(1, 5)
+            order[i], order[j] = order[j], order[i]
+        compSteps = [[] for s in range(small_instance.nservers)]
+        for fname in order:
+            compSteps[rng.randrange(small_instance.nservers)].append(fname)
+        expected = sweep_score(small_instance, compSteps)
+        if expected is None:
+            deadlocks += 1
+            with pytest.raises(ValueError):
+                score(small_instance, compSteps)
+        else:
+            assert score(small_instance, compSteps) == expected
+    assert 0 < deadlocks < 200
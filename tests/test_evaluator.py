@@ -0,0 +1,98 @@
+import random
+import pytest
+from instance import loadInstance
+from generate import generate_instance
+from solution import Solution
+from evaluator import DeltaEvaluator
+from conftest import random_schedule
+
+
+def full_score(instance, evaluator: DeltaEvaluator) -> int:
+    solution = Solution(instance.nservers)
+    solution.compSteps = [evaluator.steps(s) for s in range(instance.nservers)]
+    return solution.evalCheck(instance)
+
+
+def random_edit(evaluator: DeltaEvaluator, names: "list[str]", rng: random.Random):
+    queues = evaluator.queues
+    servers = [s for s in range(evaluator.nservers) if queues[s]]
+    server = rng.choice(servers)
+    idx = rng.randrange(len(queues[server]))
+    kind = rng.choice(['move', 'swap', 'insert', 'remove'])
+    if kind == 'move':
+        to_server = rng.randrange(evaluator.nservers)
+        to_len = len(queues[to_server]) - (to_server == server)
+        return evaluator.move(server, idx, to_server, rng.randint(0, to_len))
+    if kind == 'swap':
+        return evaluator.swap(server, idx, rng.randrange(len(queues[server])))
+    if kind == 'insert':
+        return evaluator.insert(rng.choice(names), server, rng.randint(0, len(queues[server])))
+    return evaluator.remove(server, idx)
+
+
+def test_delta_evaluator_matches_full_simulation(small_instance):
+    rng = random.Random(0)
+    solution = Solution(small_instance.nservers)
+    solution.compSteps = random_schedule(small_instance, rng)
+    evaluator = DeltaEvaluator(small_instance, solution)
+    assert evaluator.score == solution.evalCheck(small_instance)
+    names = list(small_instance.files)
+
+    for _ in range(1500):
+        before = evaluator.score
+        delta = random_edit(evaluator, names, rng)
+        if delta is None:
+            # infeasible edits leave the schedule as it was
+            assert evaluator.score == before
+        else:
+            assert evaluator.score == before + delta
+        assert evaluator.score == full_score(small_instance, evaluator)
+        if rng.random() < 0.3:
+            evaluator.rollback()
+            assert evaluator.score == full_score(small_instance, evaluator)
+        elif rng.random() < 0.5:
+            evaluator.commit()
+
+
+@pytest.mark.parametrize('nservers, seed', [(3, 2), (4, 5), (5, 0)])
+def test_delta_evaluator_matches_full_simulation_with_duplicates(tmp_path, nservers, seed):
+    # many files compiled more than once, whose compilations a step can only use in the order evalCheck
+    # handles the steps in
+    path = str(tmp_path / 'dups.in')
+    generate_instance(path, nfiles=60, ntargets=8, nservers=nservers, depth=6, fan_in=3, tightness=3.0, seed=seed)
+    instance = loadInstance(path)
+    rng = random.Random(seed)
+    solution = Solution(instance.nservers)
+    solution.compSteps = random_schedule(instance, rng)
+    evaluator = DeltaEvaluator(instance, solution)
+    names = list(instance.files)
+
+    for _ in range(600):
+        if rng.random() < 0.5:
+            server = rng.randrange(evaluator.nservers)
+            evaluator.insert(rng.choice(names), server, rng.randint(0, len(evaluator.queues[server])))
+        else:
+            random_edit(evaluator, names, rng)
+        assert evaluator.score == full_score(instance, evaluator)
+        if rng.random() < 0.3:
+            evaluator.rollback()
+            assert evaluator.score == full_score(instance, evaluator)
+        else:
+            evaluator.commit()
+
+
+def test_rollback_restores_the_committed_schedule(small_instance):
+    rng = random.Random(1)
+    solution = Solution(small_instance.nservers)
+    solution.compSteps = random_schedule(small_instance, rng)
+    evaluator = DeltaEvaluator(small_instance, solution)
+    names = list(small_instance.files)
+
+    for _ in range(200):
+        steps = [evaluator.steps(s) for s in range(evaluator.nservers)]
+        score = evaluator.score
+        for _ in range(rng.randint(1, 5)):
+            random_edit(evaluator, names, rng)
+        evaluator.rollback()
+        assert [evaluator.steps(s) for s in range(evaluator.nservers)] == steps
+        assert evaluator.score == score
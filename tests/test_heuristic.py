@@ -0,0 +1,43 @@
+import pytest
+from instance import loadInstance
+from generate import generate_instance
+from closure import ClosureIndex
+from solution import Solution
+from heuristic import vectorized_list_schedule
+from solver import heuristically_solve_sub_instance, VECTORIZED_MIN_SERVERS
+
+
+def greedy_schedule(sub_instance) -> Solution:
+    """
+    The list scheduling of heuristically_solve_sub_instance on narrow instances, one server at a time.
+    """
+    solution = Solution(sub_instance.nservers)
+    for cf in sub_instance.filesList:
+        solution.add_step(cf.name, solution.get_earliest_server_for_file(cf.name, sub_instance), sub_instance)
+    return solution
+
+
+def schedule(solution: Solution):
+    return [list(steps) for steps in solution.compSteps], \
+        sorted((f.sched_time, f.server, f.fname) for f in solution.filesCompTimeList)
+
+
+# equal compilation and replication times make many servers tie for each file
+@pytest.mark.parametrize('nservers, ctime, rtime, seed', [
+    (VECTORIZED_MIN_SERVERS, (1, 100), (1, 100), 0),
+    (64, (10, 10), (5, 5), 1),
+    (100, (1, 3), (20, 20), 2),
+])
+def test_vectorized_kernel_matches_the_greedy(tmp_path, nservers, ctime, rtime, seed):
+    path = str(tmp_path / 'wide.in')
+    generate_instance(path, nfiles=300, ntargets=12, nservers=nservers, depth=8, fan_in=3, ctime=ctime, rtime=rtime,
+                      seed=seed)
+    instance = loadInstance(path)
+    closure_index = ClosureIndex(instance)
+    sub_inst = [closure_index.sub_instance(target) for target in instance.targets]
+    sub_inst.append(closure_index.cluster_sub_instance(instance.targets))
+
+    for sub_instance in sub_inst:
+        expected = schedule(greedy_schedule(sub_instance))
+        assert schedule(vectorized_list_schedule(sub_instance)) == expected
+        assert schedule(heuristically_solve_sub_instance(sub_instance)) == expected
@@ -0,0 +1,50 @@
+import random
+from intervals import FreeIntervals
+
+
+def naive_gaps(busy: "list[tuple[int, int]]") -> "list[tuple[int, int]]":
+    gaps, t = [], 0
+    for start, end in sorted(busy):
+        if start > t:
+            gaps.append((t, start))
+        t = end
+    return gaps
+
+
+def naive_earliest_start(busy, t: int, length: int) -> int:
+    tail = max((end for _, end in busy), default=0)
+    starts = [start for start, end in naive_gaps(busy) if start >= t and end - start > length]
+    return min(starts) if starts else max(tail, t)
+
+
+def test_free_intervals_match_a_full_recompute():
+    rng = random.Random(0)
+    for _ in range(20):
+        intervals = FreeIntervals()
+        busy = []       # reserved [start, end) intervals, in reservation order
+        changes = []
+        for _ in range(300):
+            gaps = naive_gaps(busy)
+            if busy and rng.random() < 0.15:
+                # undo the last few reservations
+                for _ in range(rng.randint(1, min(5, len(busy)))):
+                    intervals.undo(changes.pop())
+                    busy.pop()
+            elif gaps and rng.random() < 0.3:
+                # a compilation recorded anywhere inside a gap (may split it)
+                start, end = rng.choice(gaps)
+                s = rng.randrange(start, end)
+                e = rng.randint(s + 1, end)
+                changes.append(intervals.reserve(s, e - s))
+                busy.append((s, e))
+            else:
+                t, length = rng.randint(0, 400), rng.randint(1, 30)
+                start = intervals.earliest_start(t, length)
+                assert start == naive_earliest_start(busy, t, length)
+                changes.append(intervals.reserve(start, length))
+                busy.append((start, start + length))
+            assert intervals.tail == max((end for _, end in busy), default=0)
+            assert intervals.longest_gap() == max((end - start for start, end in naive_gaps(busy)), default=0)
+            for _ in range(5):
+                t, length = rng.randint(0, 400), rng.randint(1, 30)
+                assert intervals.earliest_start(t, length) == naive_earliest_start(busy, t, length)
@@ -0,0 +1,55 @@
+import random
+from solution import Solution
+
+
+def state(solution: Solution, queries) -> dict:
+    """
+    Everything the solver reads from a Solution, in a form which does not depend on the order the steps
+    were recorded in.
+    """
+    return {
+        'steps': sorted((f.sched_time, f.server, f.fname) for f in solution.filesCompTimeList),
+        'compSteps': [list(steps) for steps in solution.compSteps],
+        'stepTimes': [list(times) for times in solution.stepTimes],
+        'avail': {fname: solution.availTimes(fname).tolist() for fname in solution.fileRows},
+        'earliest': {fname: solution.earliestAvailTime(fname) for fname in solution.fileRows},
+        'scheduled': set(solution.scheduled),
+        'stepSets': [set(files) for files in solution.stepSets],
+        'compTimes': dict(solution.filesCompTimeDict),
+        'currTime': list(solution.currTime),
+        'starts': [[intervals.earliest_start(t, length) for t, length in queries]
+                   for intervals in solution.freeIntervals],
+    }
+
+
+def rebuilt(solution: Solution, instance) -> Solution:
+    fresh = Solution(solution.nservers)
+    for sched_time, server, fname in sorted((f.sched_time, f.server, f.fname) for f in solution.filesCompTimeList):
+        fresh.recordNewCompilation(instance, sched_time, server, fname)
+    return fresh
+
+
+def test_rollback_and_commit_match_a_full_recompute(small_instance):
+    rng = random.Random(0)
+    queries = [(rng.randint(0, 2000), rng.randint(1, 100)) for _ in range(20)]
+    names = list(small_instance.files)     # in topological order
+    solution = Solution(small_instance.nservers)
+    done = 0
+    while done < len(names):
+        before = state(solution, queries)
+        solution.checkpoint()
+        batch = names[done:done + rng.randint(1, 6)]
+        for fname in batch:
+            server = solution.get_earliest_server_for_file(fname, small_instance) if rng.random() < 0.5 \
+                else rng.randrange(solution.nservers)
+            solution.add_step(fname, server, small_instance)
+            if done and rng.random() < 0.2:
+                # compile again a file already scheduled, possibly inside a gap
+                solution.add_step(rng.choice(names[:done]), rng.randrange(solution.nservers), small_instance)
+        if rng.random() < 0.4:
+            solution.rollback()
+            assert state(solution, queries) == before
+        else:
+            solution.commit()
+            done += len(batch)
+            assert state(solution, queries) == state(rebuilt(solution, small_instance), queries)
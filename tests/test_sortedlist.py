@@ -0,0 +1,38 @@
+import random
+import pytest
+from bisect import bisect_left
+from sortedlist import SortedKeyList
+
+
+class Value():
+    pass
+
+
+def test_sorted_key_list_matches_a_sorted_list():
+    rng = random.Random(0)
+    skl = SortedKeyList(load=4)     # small buckets, so that they get split and emptied
+    keys, values = [], []           # the same content, as a plain list kept sorted by insertion
+    for _ in range(3000):
+        if values and rng.random() < 0.4:
+            i = rng.randrange(len(values))
+            skl.remove(keys[i], values[i])
+            del keys[i]
+            del values[i]
+        else:
+            key, value = rng.randint(0, 50), Value()
+            skl.insert(key, value)
+            i = bisect_left(keys, key)
+            keys.insert(i, key)
+            values.insert(i, value)
+        assert len(skl) == len(values)
+        assert all(a is b for a, b in zip(skl, values))
+        if values:
+            i = rng.randrange(len(values))
+            assert skl[i] is values[i] and skl[i - len(values)] is values[i]
+
+
+def test_remove_missing_value_raises():
+    skl = SortedKeyList()
+    skl.insert(1, Value())
+    with pytest.raises(ValueError):
+        skl.remove(1, Value())